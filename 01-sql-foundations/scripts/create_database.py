@@ -2,19 +2,26 @@
 import sqlite3
 import os
 
-def create_database():
-    print("🚀 Starting SQL Database Creation...")
-    
-    # Create data directory if it doesn't exist
-    os.makedirs('../data', exist_ok=True)
-    
-    # Create a connection to our database
-    conn = sqlite3.connect('../data/ecommerce.db')
-    cursor = conn.cursor()
-
-    print("✅ Database connection created!")
+from user_features import CREATE_CHURN_INDEX, create_user_features
+
+# Every join and filter in analysis_queries.sql and the churn feature queries
+# goes through one of these; query_plan_report.py checks the plans
+INDEXES = [
+    CREATE_CHURN_INDEX,
+    'CREATE INDEX IF NOT EXISTS idx_orders_product ON orders (product_id)',
+    'CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (order_date)',
+    'CREATE INDEX IF NOT EXISTS idx_users_country ON users (country)',
+]
+
+def create_indexes(conn):
+    for index in INDEXES:
+        conn.execute(index)
+    conn.commit()
 
+def create_schema(cursor):
+    """Drop and recreate the users, products and orders tables (without indexes)"""
     # Drop tables if they exist (for clean setup)
+    cursor.execute('DROP TABLE IF EXISTS user_features')
     cursor.execute('DROP TABLE IF EXISTS orders')
     cursor.execute('DROP TABLE IF EXISTS users')
     cursor.execute('DROP TABLE IF EXISTS products')
@@ -54,8 +61,24 @@ def create_database():
     )
     ''')
 
+def create_database():
+    print("🚀 Starting SQL Database Creation...")
+    
+    # Create data directory if it doesn't exist
+    os.makedirs('../data', exist_ok=True)
+    
+    # Create a connection to our database
+    conn = sqlite3.connect('../data/ecommerce.db')
+    cursor = conn.cursor()
+
+    print("✅ Database connection created!")
+
+    create_schema(cursor)
     print("✅ Tables created successfully!")
 
+    create_indexes(conn)
+    print("✅ Indexes created successfully!")
+
     # Add sample users
     users_data = [
         (1, 'alice@email.com', '2024-01-15', 'USA'),
@@ -97,6 +120,10 @@ def create_database():
     conn.commit()
     print("✅ All data committed successfully!")
 
+    # Per-user aggregates for the churn model, kept current by triggers on orders
+    create_user_features(conn)
+    print("✅ user_features table and triggers created!")
+
     # Verify data
     print("\n📊 Database Summary:")
     
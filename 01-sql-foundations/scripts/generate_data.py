@@ -0,0 +1,143 @@
+# generate_data.py - Seedable synthetic ecommerce data at benchmark scale
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date
+
+import numpy as np
+
+from create_database import create_indexes, create_schema
+from user_features import create_user_features
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+COUNTRIES = ['USA', 'UK', 'Canada', 'Germany', 'France', 'Australia']
+COUNTRY_WEIGHTS = [0.40, 0.15, 0.12, 0.13, 0.10, 0.10]
+CATEGORIES = ['Electronics', 'Furniture', 'Home', 'Office', 'Books', 'Clothing']
+
+def tune(conn, synchronous, cache_mb):
+    """PRAGMAs for a bulk load: WAL journal, relaxed fsyncs and a large page cache"""
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+    conn.execute(f'PRAGMA cache_size = {-cache_mb * 1024}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+def to_dates(today, days_ago):
+    """ISO date strings for integer day offsets before today"""
+    return (np.datetime64(today) - days_ago.astype('timedelta64[D]')).astype(str)
+
+def generate_products(rng, n_products):
+    product_ids = np.arange(1, n_products + 1)
+    prices = np.round(rng.lognormal(mean=3.5, sigma=1.0, size=n_products), 2)
+    categories = rng.choice(CATEGORIES, size=n_products)
+    rows = zip(product_ids.tolist(), [f'Product {i}' for i in product_ids], categories.tolist(), prices.tolist())
+    # A few bestsellers and a long tail, as in real catalogues
+    popularity = 1.0 / np.arange(1, n_products + 1) ** 1.1
+    return rows, prices, popularity / popularity.sum()
+
+def generate_chunk(rng, today, first_user_id, n_users, args, prices, popularity, first_order_id):
+    """Users [first_user_id, first_user_id + n_users) and all of their orders"""
+    user_ids = np.arange(first_user_id, first_user_id + n_users)
+    signup_days_ago = rng.integers(30, 3 * 365, size=n_users)
+    users = zip(user_ids.tolist(), [f'user{i}@example.com' for i in user_ids],
+                to_dates(today, signup_days_ago).tolist(),
+                rng.choice(COUNTRIES, size=n_users, p=COUNTRY_WEIGHTS).tolist())
+
+    # Gamma-Poisson order counts: most users order a few times, some a lot,
+    # and some never order at all
+    n_orders = rng.poisson(rng.gamma(shape=1.5, scale=args.orders_per_user / 1.5, size=n_users))
+
+    # Churned users last ordered more than 90 days ago; active users recently
+    churned = rng.random(n_users) < args.churn_rate
+    last_order = np.where(churned,
+                          rng.uniform(91, np.maximum(signup_days_ago, 92)),
+                          np.minimum(rng.exponential(scale=15, size=n_users), 90))
+    last_order = np.minimum(last_order, signup_days_ago)
+
+    # Each user's first order row is their most recent one; the rest fall
+    # anywhere between signup and that date
+    owner = np.repeat(np.arange(n_users), n_orders)
+    is_latest = np.ones(len(owner), dtype=bool)
+    is_latest[1:] = owner[1:] != owner[:-1]
+    spread = np.where(is_latest, 0.0, rng.random(len(owner)))
+    days_ago = (last_order[owner] + spread * (signup_days_ago[owner] - last_order[owner])).astype(np.int64)
+
+    product_idx = rng.choice(len(prices), size=len(owner), p=popularity)
+    quantity = 1 + rng.poisson(0.4, size=len(owner))
+    amount = np.round(prices[product_idx] * quantity, 2)
+    status = np.where(days_ago < 7, 'processing', np.where(days_ago < 14, 'shipped', 'delivered'))
+    status = np.where(rng.random(len(owner)) < 0.03, 'cancelled', status)
+
+    orders = zip(range(first_order_id, first_order_id + len(owner)), user_ids[owner].tolist(),
+                 (product_idx + 1).tolist(), to_dates(today, days_ago).tolist(),
+                 quantity.tolist(), amount.tolist(), status.tolist())
+    return users, orders, len(owner)
+
+def generate(args):
+    today = date.fromisoformat(args.today)
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    conn = sqlite3.connect(args.db)
+    tune(conn, args.synchronous, args.cache_mb)
+    create_schema(conn.cursor())
+    conn.commit()
+
+    product_rows, prices, popularity = generate_products(rng, args.products)
+    conn.executemany('INSERT INTO products VALUES (?, ?, ?, ?)', product_rows)
+    conn.commit()
+
+    start = time.perf_counter()
+    total_orders = 0
+    for first_user_id in range(1, args.users + 1, args.chunk_users):
+        n_users = min(args.chunk_users, args.users + 1 - first_user_id)
+        users, orders, n_orders = generate_chunk(rng, today, first_user_id, n_users, args,
+                                                 prices, popularity, total_orders + 1)
+        # One transaction per chunk
+        conn.executemany('INSERT INTO users VALUES (?, ?, ?, ?)', users)
+        conn.executemany('INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)', orders)
+        conn.commit()
+        total_orders += n_orders
+        elapsed = time.perf_counter() - start
+        done = first_user_id + n_users - 1
+        print(f"   {done:>10,} users {total_orders:>12,} orders "
+              f"{(done + total_orders) / elapsed:>10,.0f} rows/s")
+    load_s = time.perf_counter() - start
+
+    # Indexes and user_features are built once at the end, which is much
+    # cheaper than maintaining them row by row during the load
+    start = time.perf_counter()
+    create_indexes(conn)
+    create_user_features(conn)
+    conn.execute('ANALYZE')
+    conn.commit()
+    index_s = time.perf_counter() - start
+    conn.close()
+    return total_orders, load_s, index_s
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic ecommerce database')
+    parser.add_argument('--db', default=os.path.join(script_dir, '../data/ecommerce_synthetic.db'))
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--products', type=int, default=1_000)
+    parser.add_argument('--orders-per-user', type=float, default=10.0, help='mean orders per user')
+    parser.add_argument('--churn-rate', type=float, default=0.3,
+                        help='share of users whose last order is more than 90 days old')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--today', default=date.today().isoformat(),
+                        help='date the order history ends; fix it to reproduce a database exactly')
+    parser.add_argument('--chunk-users', type=int, default=50_000, help='users generated per transaction')
+    parser.add_argument('--synchronous', default='OFF', choices=['OFF', 'NORMAL', 'FULL'])
+    parser.add_argument('--cache-mb', type=int, default=256)
+    args = parser.parse_args()
+
+    print(f"🏭 Generating {args.users:,} users into {args.db} (seed {args.seed})")
+    total_orders, load_s, index_s = generate(args)
+
+    rows = args.users + total_orders
+    print(f"\n✅ {args.users:,} users, {args.products:,} products, {total_orders:,} orders")
+    print(f"   Load: {load_s:.1f}s ({rows / load_s:,.0f} rows/s)")
+    print(f"   Indexes + user_features: {index_s:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# ingest_orders.py - Bulk upsert orders from CSV / NDJSON files in short transactions
+import argparse
+import csv
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+from itertools import chain, islice
+
+from user_features import create_user_features, drop_triggers, refresh_users
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+COLUMNS = ['order_id', 'user_id', 'product_id', 'order_date', 'quantity', 'amount', 'status']
+REQUIRED = ['user_id', 'order_date', 'amount']
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+# A row with a new (or no) order_id is appended; an existing order_id is
+# overwritten in place, so re-running a file or loading corrections is safe
+UPSERT_ORDERS = f"""
+INSERT INTO orders ({', '.join(COLUMNS)}) {{source}}
+ON CONFLICT (order_id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:])}
+"""
+VALUES = f"VALUES ({', '.join('?' * len(COLUMNS))})"
+# WHERE true keeps SQLite from reading ON CONFLICT as a join constraint
+STAGED = f"SELECT {', '.join(COLUMNS)} FROM staged_orders WHERE true"
+
+CREATE_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS staged_orders (
+    order_id INTEGER, user_id INTEGER, product_id INTEGER, order_date DATE,
+    quantity INTEGER, amount REAL, status TEXT
+)
+"""
+INSERT_STAGED = f"INSERT INTO staged_orders VALUES ({', '.join('?' * len(COLUMNS))})"
+CREATE_TOUCHED = 'CREATE TEMP TABLE IF NOT EXISTS touched_users (user_id INTEGER PRIMARY KEY)'
+
+def read_records(path, fmt):
+    """(line number, record dict) for every row of a CSV or NDJSON file; '-' reads stdin"""
+    f = sys.stdin if path == '-' else open(path, newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_num, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield line_num, json.loads(line)
+                    except ValueError as e:
+                        yield line_num, e
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def optional_int(value):
+    return None if value is None or value == '' else int(value)
+
+def parse_order(record):
+    """One orders row from a parsed record; raises KeyError, ValueError or TypeError for a bad one"""
+    if isinstance(record, Exception):
+        raise ValueError(f"not JSON: {record}")
+    for field in REQUIRED:
+        if record.get(field) is None or record.get(field) == '':
+            raise KeyError(field)
+    order_date = str(record['order_date'])
+    date.fromisoformat(order_date[:10])
+    amount = float(record['amount'])
+    if not math.isfinite(amount):
+        raise ValueError(f"amount must be a finite number, got {record['amount']!r}")
+    return (optional_int(record.get('order_id')), int(record['user_id']), optional_int(record.get('product_id')),
+            order_date, optional_int(record.get('quantity')), amount, record.get('status') or None)
+
+def parse_orders(records, rejected, max_samples=10):
+    """Valid orders rows from (line, record) pairs; bad rows are counted in rejected and skipped"""
+    for line, record in records:
+        try:
+            yield parse_order(record)
+        except (KeyError, ValueError, TypeError) as e:
+            rejected['count'] += 1
+            if len(rejected['samples']) < max_samples:
+                rejected['samples'].append((line, f"{type(e).__name__}: {e}"))
+
+def ingest(conn, rows, batch_rows=5_000, transaction_rows=50_000, defer_features=False, progress=None):
+    """
+    Upsert rows into orders with one executemany per batch_rows and one
+    transaction per transaction_rows; returns the number of rows written.
+
+    Each transaction holds the write lock only for its own rows, so readers
+    (and, in WAL mode, everything but other writers) are never held up for
+    long. With defer_features the user_features triggers must already be
+    dropped: rows are staged, upserted with one statement and every user they
+    touch is refreshed once, in the same transaction.
+    """
+    if defer_features:
+        conn.execute(CREATE_STAGING)
+        conn.execute(CREATE_TOUCHED)
+    rows = iter(rows)
+    written = 0
+    while True:
+        # Take the write lock up front instead of upgrading a read lock mid-way
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            in_transaction = 0
+            while in_transaction < transaction_rows:
+                batch = list(islice(rows, min(batch_rows, transaction_rows - in_transaction)))
+                if not batch:
+                    break
+                if defer_features:
+                    conn.executemany(INSERT_STAGED, batch)
+                else:
+                    conn.executemany(UPSERT_ORDERS.format(source=VALUES), batch)
+                in_transaction += len(batch)
+            if defer_features and in_transaction:
+                # Users an updated order moves away from, as well as the ones it lands on
+                conn.execute('INSERT OR IGNORE INTO touched_users '
+                             'SELECT o.user_id FROM staged_orders s JOIN orders o ON o.order_id = s.order_id')
+                conn.execute('INSERT OR IGNORE INTO touched_users SELECT user_id FROM staged_orders')
+                conn.execute(UPSERT_ORDERS.format(source=STAGED))
+                refresh_users(conn, 'touched_users')
+                conn.execute('DELETE FROM staged_orders')
+                conn.execute('DELETE FROM touched_users')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        written += in_transaction
+        if progress is not None and in_transaction:
+            progress(written)
+        if in_transaction < transaction_rows:
+            return written
+
+def file_format(path, fmt=None):
+    fmt = fmt or FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise SystemExit(f"❌ Cannot tell the format of {path}: pass --format csv|ndjson")
+    return fmt
+
+def main():
+    parser = argparse.ArgumentParser(description='Append or upsert orders from CSV / NDJSON files')
+    parser.add_argument('files', nargs='+', help="CSV or NDJSON files with orders columns; '-' for stdin")
+    parser.add_argument('--db', default=os.path.join(script_dir, '../data/ecommerce.db'))
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='default: from each file extension')
+    parser.add_argument('--batch-rows', type=int, default=5_000, help='rows per executemany')
+    parser.add_argument('--transaction-rows', type=int, default=50_000,
+                        help='rows per transaction; smaller keeps the write lock shorter')
+    parser.add_argument('--wal', action='store_true',
+                        help='switch the database to WAL so readers never wait for the load')
+    parser.add_argument('--synchronous', default='NORMAL', choices=['OFF', 'NORMAL', 'FULL'])
+    parser.add_argument('--cache-mb', type=int, default=256,
+                        help='page cache; random index inserts slow down sharply once it is full')
+    parser.add_argument('--busy-timeout', type=float, default=30.0,
+                        help='seconds to wait for another writer before failing')
+    parser.add_argument('--defer-features', action='store_true',
+                        help='refresh user_features once per user per transaction instead of per row; '
+                             'drops the triggers during the load, so only when no other process writes orders')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found at: {args.db}")
+        print("Please run create_database.py first!")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.db, timeout=args.busy_timeout)
+    if args.wal:
+        conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA synchronous = {args.synchronous}')
+    conn.execute(f'PRAGMA cache_size = {-args.cache_mb * 1024}')
+    # Covering index and triggers, so every per-row refresh is an index range
+    create_user_features(conn)
+    before = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    rejected = {'count': 0, 'samples': []}
+    records = chain.from_iterable(read_records(path, file_format(path, args.format)) for path in args.files)
+    start = time.perf_counter()
+
+    def progress(written):
+        print(f"   {written:>12,} orders {written / (time.perf_counter() - start):>10,.0f} rows/s")
+
+    print(f"📥 Loading orders from {len(args.files)} file(s) into {args.db}")
+    if args.defer_features:
+        drop_triggers(conn)
+        conn.commit()
+    try:
+        written = ingest(conn, parse_orders(records, rejected), args.batch_rows, args.transaction_rows,
+                         args.defer_features, progress)
+    finally:
+        if args.defer_features:
+            create_user_features(conn)
+    seconds = time.perf_counter() - start
+    after = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+    conn.close()
+
+    print(f"\n✅ {written:,} orders written in {seconds:.1f}s ({written / max(seconds, 1e-9):,.0f} rows/s)")
+    print(f"   New: {after - before:,}  Updated: {written - (after - before):,}  Rejected: {rejected['count']:,}")
+    for line, error in rejected['samples']:
+        print(f"   ⚠️  line {line}: {error}")
+
+if __name__ == "__main__":
+    main()
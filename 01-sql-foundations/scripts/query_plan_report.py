@@ -0,0 +1,94 @@
+# query_plan_report.py - EXPLAIN QUERY PLAN and timings for the analysis and churn feature queries
+import argparse
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import time
+
+from create_database import create_indexes
+from user_features import POINT_IN_TIME_FEATURES_QUERY, USER_AGGREGATES, create_user_features, features_query
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+def analysis_queries(path):
+    """(name, sql) for every statement in analysis_queries.sql, named after its '-- N. ...' comment"""
+    with open(path) as f:
+        text = f.read()
+    queries = []
+    for statement in text.split(';'):
+        title = re.search(r'--\s*(\d+\..*)', statement)
+        sql = '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+        if sql:
+            queries.append((title.group(1).strip() if title else sql.split('\n')[0], sql))
+    return queries
+
+def churn_queries(conn):
+    """
+    The churn feature queries as the scorer and the user_features triggers run
+    them. Lookups must never scan a whole table, whatever the table size.
+    """
+    user_id = conn.execute('SELECT MIN(user_id) FROM users').fetchone()[0] or 1
+    ids = [row[0] for row in conn.execute('SELECT user_id FROM users LIMIT 100')] or [user_id]
+    return [
+        ('churn features: all users', features_query(conn), [], False),
+        ('churn features: one user', features_query(conn, where='WHERE u.user_id = ?'), [user_id], True),
+        ('churn features: IN list', features_query(
+            conn, where=f"WHERE u.user_id IN ({', '.join('?' * len(ids))})"), ids, True),
+        ('churn features: one user, point in time', POINT_IN_TIME_FEATURES_QUERY.format(
+            as_of='2000-01-01', join='', where='WHERE u.user_id = ?'), [user_id], True),
+        ('user_features trigger refresh', USER_AGGREGATES.format(where='WHERE user_id = ?'), [user_id], True),
+    ]
+
+def full_scans(plan):
+    """Plan steps that read a whole table or index instead of searching it"""
+    return [detail for _, _, _, detail in plan if detail.startswith('SCAN') and 'CONSTANT ROW' not in detail]
+
+def run(conn, name, sql, params, lookup, repeat):
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        timings.append(time.perf_counter() - start)
+
+    scans = full_scans(plan)
+    flag = "❌" if lookup and scans else "⚠️ " if scans else "✅"
+    print(f"{flag} {name}: {len(rows)} rows, median {statistics.median(timings) * 1000:.2f}ms")
+    for _, _, _, detail in plan:
+        print(f"      {detail}")
+    return not (lookup and scans)
+
+def main():
+    parser = argparse.ArgumentParser(description='Query plans and timings for the ecommerce queries')
+    parser.add_argument('--db', default=os.path.join(script_dir, '../data/ecommerce.db'))
+    parser.add_argument('--sql', default=os.path.join(script_dir, 'analysis_queries.sql'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--create-indexes', action='store_true',
+                        help='add the schema indexes and user_features to an older database first')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found at: {args.db}")
+        print("Please run create_database.py first!")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.db)
+    if args.create_indexes:
+        create_indexes(conn)
+        create_user_features(conn)
+    elif not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'user_features'").fetchone():
+        print("❌ user_features not found: run with --create-indexes to add it")
+        sys.exit(1)
+
+    print(f"🔍 Query plans for {args.db} (median of {args.repeat} runs)\n")
+    queries = [(name, sql, [], False) for name, sql in analysis_queries(args.sql)]
+    ok = all([run(conn, *query, args.repeat) for query in queries + churn_queries(conn)])
+    conn.close()
+
+    print("\n✅ No lookup scans a whole table" if ok else "\n❌ Some lookups scan a whole table: check the indexes")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmark_feature_extraction.py - Per-user feature queries vs one set-based extraction
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from predict_churn import DB_PATH, ChurnScorer
+from user_features import as_of_date, features_query
+
+def per_user_features(conn, scorer, user_ids, as_of):
+    """The old path: one feature query and one encoding per customer"""
+    query = features_query(conn, as_of, where='WHERE u.user_id = ?')
+    rows = []
+    for user_id in user_ids:
+        customer_data = pd.read_sql_query(query, conn, params=[int(user_id)])
+        if not customer_data.empty:
+            rows.append(scorer.prepare_features(customer_data))
+    return pd.concat(rows, ignore_index=True)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-user vs set-based churn feature extraction')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--users', type=int, default=2000, help='how many user IDs to extract features for')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--as-of', help='feature date (YYYY-MM-DD), today by default')
+    args = parser.parse_args()
+    as_of = as_of_date(args.as_of)
+
+    with ChurnScorer(db_path=args.db) as scorer:
+        all_ids = pd.read_sql_query('SELECT user_id FROM users', scorer.conn)['user_id'].to_numpy()
+        rng = np.random.RandomState(args.seed)
+        user_ids = rng.choice(all_ids, size=min(args.users, len(all_ids)), replace=False)
+        print(f"🧪 Extracting features as of {as_of} for {len(user_ids)} of {len(all_ids)} users from {args.db}\n")
+
+        conn = sqlite3.connect(args.db)
+        per_user, per_user_s = timed(per_user_features, conn, scorer, np.sort(user_ids), as_of)
+        conn.close()
+        (ids, bulk), bulk_s = timed(scorer.feature_matrix, user_ids, as_of)
+        (_, everyone), table_s = timed(scorer.feature_matrix, None, as_of)
+
+        # Both paths must produce the same matrix
+        np.testing.assert_array_equal(bulk.to_numpy(dtype=float), per_user.to_numpy(dtype=float))
+        assert list(bulk.columns) == list(scorer.feature_names)
+
+    print(f"   {'path':<28} {'seconds':>9} {'users/s':>10}")
+    print(f"   {'per-user queries':<28} {per_user_s:>9.3f} {len(ids) / per_user_s:>10.0f}")
+    print(f"   {'one grouped aggregate':<28} {bulk_s:>9.3f} {len(ids) / bulk_s:>10.0f}")
+    print(f"   {'whole users table':<28} {table_s:>9.3f} {len(everyone) / table_s:>10.0f}")
+    print(f"\n🚀 Set-based extraction is {per_user_s / bulk_s:.0f}x faster than per-user queries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmark_training_loader.py - Peak memory and load time of the training data loaders
+import argparse
+import multiprocessing as mp
+import os
+import resource
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+def load_pandas(conn):
+    """The old path: the whole query as float64/object columns, then fillna and get_dummies"""
+    import pandas as pd
+    from training_data import training_query
+
+    df = pd.read_sql_query(training_query(conn), conn)
+    df.fillna(0, inplace=True)
+    X = df.drop(['user_id', 'is_churned'], axis=1)
+    y = df['is_churned']
+    return pd.get_dummies(X, columns=['country'], prefix='country'), y
+
+def load_chunked(conn):
+    from training_data import load_training_data
+    return load_training_data(conn)
+
+def worker(mode, db_path, results):
+    """Load the training set once in a fresh process and report time and peak memory"""
+    import sqlite3
+    import time
+    import pandas  # noqa: F401 - imported before the baseline is taken
+
+    conn = sqlite3.connect(db_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    X, y = (load_pandas if mode == 'pandas' else load_chunked)(conn)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conn.close()
+    matrix_mb = (X.memory_usage(deep=True).sum() + y.memory_usage(deep=True)) / 2**20
+    results.put((len(X), seconds, (peak - baseline) / 2**10, matrix_mb))
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory and load time of the churn training data loaders')
+    parser.add_argument('--db', default=os.path.join(script_dir, '../../01-sql-foundations/data/ecommerce.db'))
+    parser.add_argument('--modes', nargs='+', default=['pandas', 'chunked'])
+    args = parser.parse_args()
+
+    ctx = mp.get_context('spawn')
+    print(f"🧪 Loading the churn training set from {args.db}\n")
+    print(f"   {'loader':<10} {'rows':>12} {'seconds':>9} {'peak MB':>9} {'result MB':>10}")
+    for mode in args.modes:
+        results = ctx.Queue()
+        process = ctx.Process(target=worker, args=(mode, args.db, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            # Usually the OOM killer when the whole frame does not fit in memory
+            print(f"   {mode:<10} failed with exit code {process.exitcode}")
+            continue
+        rows, seconds, peak_mb, matrix_mb = results.get()
+        print(f"   {mode:<10} {rows:>12,} {seconds:>9.1f} {peak_mb:>9.0f} {matrix_mb:>10.0f}")
+
+if __name__ == "__main__":
+    main()
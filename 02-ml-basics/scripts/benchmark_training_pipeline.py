@@ -0,0 +1,225 @@
+# benchmark_training_pipeline.py - Per-stage time and memory of the churn training scripts at several data sizes
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(script_dir, '../../01-sql-foundations/scripts'))
+sys.path.insert(0, os.path.join(script_dir, '../../03-docker-api'))
+
+PIPELINES = ['churn_prediction', 'retrain_model']
+# Synthetic databases end here and features are taken as of this date, so
+# every run at a size sees exactly the same data
+TODAY = '2026-01-01'
+
+def reset_peak_rss():
+    """Restart the peak RSS count (Linux): a forked child starts with its parent's peak"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return None
+
+class StageTimer:
+    """Seconds per stage, summed over repeated calls, with process memory after each"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, seconds):
+        stage = self.stages.setdefault(name, {'seconds': 0.0})
+        stage['seconds'] += seconds
+        # The high-water mark only grows, so a stage's peak includes the ones before it
+        stage['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        stage['rss_mb'] = None if rss_mb() is None else round(rss_mb(), 1)
+
+    def run(self, name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.add(name, time.perf_counter() - started)
+        return result
+
+def churn_prediction_stages(db_path, n_estimators=100, chunksize=20_000):
+    """The stages of churn_prediction.py on db_path; returns (stages, details)"""
+    import joblib
+    import sqlite3
+    from sklearn.metrics import accuracy_score, classification_report
+    from sklearn.model_selection import train_test_split
+    from training_data import FOREST_PARAMS, churn_model, load_training_data
+
+    timer = StageTimer()
+    timer.add('baseline', 0.0)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        # The SQL fetch and the encoding of each chunk are timed apart
+        X, y = load_training_data(conn, TODAY, chunksize, on_chunk=timer.add)
+    finally:
+        conn.close()
+
+    X_train, X_test, y_train, y_test = timer.run(
+        'split', train_test_split, X, y, test_size=0.3, random_state=42, stratify=y)
+    model = churn_model({**FOREST_PARAMS, 'n_estimators': n_estimators})
+    timer.run('fit', model.fit, X_train, y_train)
+
+    def evaluate():
+        y_pred = model.predict(X_test)
+        model.predict_proba(X_test)
+        classification_report(y_test, y_pred, zero_division=0)
+        return accuracy_score(y_test, y_pred)
+    accuracy = timer.run('evaluation', evaluate)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'churn_predictor.pkl')
+        timer.run('dump', joblib.dump, model, path)
+        model_mb = os.path.getsize(path) / 2**20
+    return timer.stages, {'rows': len(X), 'features': X.shape[1], 'accuracy': round(float(accuracy), 4),
+                          'model_mb': round(model_mb, 2)}
+
+def retrain_model_stages(n_samples, n_estimators=100, add_trees_count=10):
+    """The stages of retrain_model.py (full, then one incremental window); returns (stages, details)"""
+    from sklearn.ensemble import RandomForestClassifier
+    import retrain_model
+
+    timer = StageTimer()
+    timer.add('baseline', 0.0)
+    df = timer.run('generation', retrain_model.generate_customers, n_samples)
+    X, y = timer.run('encoding', retrain_model.encode, df)
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=42)
+    timer.run('fit', model.fit, X, y)
+    score = timer.run('evaluation', model.score, X, y)
+    with tempfile.TemporaryDirectory() as tmp:
+        timer.run('dump', retrain_model.save_model, model, list(X.columns), tmp, mode='full')
+        model_mb = os.path.getsize(os.path.join(tmp, 'churn_predictor.pkl')) / 2**20
+    # A 1% window of new customers, as an incremental refresh would see
+    window = retrain_model.generate_customers(max(n_samples // 100, 100), seed=7)
+    X_new, y_new = retrain_model.encode(window, list(X.columns))
+    timer.run('incremental_fit', retrain_model.add_trees, model, X_new, y_new, add_trees_count)
+    return timer.stages, {'rows': len(X), 'features': X.shape[1], 'train_score': round(float(score), 4),
+                          'model_mb': round(model_mb, 2), 'incremental_rows': len(X_new)}
+
+def worker(pipeline, size, db_path, n_estimators, results):
+    reset_peak_rss()
+    if pipeline == 'churn_prediction':
+        results.put(churn_prediction_stages(db_path, n_estimators))
+    else:
+        results.put(retrain_model_stages(size, n_estimators))
+
+def ensure_database(work_dir, users, seed):
+    """A synthetic database with this many users, generated once and reused by later runs"""
+    from generate_data import generate
+    db_path = os.path.join(work_dir, f'ecommerce_{users}_{seed}.db')
+    if not os.path.exists(db_path):
+        print(f"🏭 Generating {users:,} users into {db_path}...")
+        os.makedirs(work_dir, exist_ok=True)
+        tmp_path = f"{db_path}.tmp"
+        generate(argparse.Namespace(db=tmp_path, users=users, products=1_000, orders_per_user=10.0,
+                                    churn_rate=0.3, seed=seed, today=TODAY, chunk_users=50_000,
+                                    synchronous='OFF', cache_mb=256))
+        os.replace(tmp_path, db_path)
+    return db_path
+
+def environment():
+    import numpy
+    import pandas
+    import sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_dir,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'python': platform.python_version(),
+            'numpy': numpy.__version__, 'pandas': pandas.__version__, 'sklearn': sklearn.__version__}
+
+def compare(baseline, results):
+    """Print each stage's time against the same pipeline, size and stage in a baseline run"""
+    before = {(r['pipeline'], r['size']): r for r in baseline['results'] if 'stages' in r}
+    print(f"\n📊 Against {baseline['environment'].get('commit')} ({baseline['environment']['timestamp']}):")
+    for result in results:
+        old = before.get((result['pipeline'], result['size']))
+        if old is None or 'stages' not in result:
+            continue
+        for stage, timing in result['stages'].items():
+            if stage in old['stages'] and old['stages'][stage]['seconds'] > 0:
+                ratio = timing['seconds'] / old['stages'][stage]['seconds']
+                print(f"   {result['pipeline']:<17} {result['size']:>11,} {stage:<16} {ratio:>6.2f}x time")
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage time and memory of the churn training pipelines')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000],
+                        help='users (churn_prediction) or customers (retrain_model), e.g. 1000 100000 1000000 10000000')
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=PIPELINES)
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'churn-benchmark'),
+                        help='where the synthetic databases are generated and kept between runs')
+    parser.add_argument('--output', help='JSON results file (default: benchmark_<commit>.json in --work-dir)')
+    parser.add_argument('--compare', help='an earlier results file to compare stage times against')
+    args = parser.parse_args()
+
+    env = environment()
+    output = args.output or os.path.join(args.work_dir, f"benchmark_{env['commit'] or 'unknown'}.json")
+    ctx = mp.get_context('spawn')
+    results = []
+    for size in args.sizes:
+        for pipeline in args.pipelines:
+            db_path = ensure_database(args.work_dir, size, args.seed) if pipeline == 'churn_prediction' else None
+            queue = ctx.Queue()
+            # A fresh process per run, so peak memory is this run's alone
+            process = ctx.Process(target=worker, args=(pipeline, size, db_path, args.n_estimators, queue))
+            process.start()
+            process.join()
+            result = {'pipeline': pipeline, 'size': size, 'n_estimators': args.n_estimators}
+            if process.exitcode != 0:
+                # Usually the OOM killer at the larger sizes
+                result['failed'] = f"exit code {process.exitcode}"
+                print(f"❌ {pipeline} at {size:,}: {result['failed']}")
+            else:
+                stages, details = queue.get()
+                result.update(details, stages=stages,
+                              total_seconds=round(sum(s['seconds'] for s in stages.values()), 4))
+                print(f"\n⏱️  {pipeline} at {size:,} ({result['total_seconds']:.2f}s)")
+                print(f"   {'stage':<16} {'seconds':>9} {'peak MB':>9} {'RSS MB':>9}")
+                for stage, timing in stages.items():
+                    print(f"   {stage:<16} {timing['seconds']:>9.3f} {timing['peak_rss_mb']:>9.0f} "
+                          f"{timing['rss_mb'] or 0:>9.0f}")
+            results.append(result)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': env, 'results': results}, f, indent=2)
+    print(f"\n💾 Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
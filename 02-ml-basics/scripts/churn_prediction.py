@@ -1,12 +1,11 @@
 # churn_prediction.py - IMPROVED VERSION
-import sqlite3
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
 import numpy as np
 import os
+import sys
 
 print("🎯 Starting Customer Churn Prediction Model...")
 
@@ -14,6 +13,13 @@ print("🎯 Starting Customer Churn Prediction Model...")
 script_dir = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.join(script_dir, '../../01-sql-foundations/data/ecommerce.db')
 
+sys.path.insert(0, os.path.join(script_dir, '../../01-sql-foundations/scripts'))
+sys.path.insert(0, os.path.join(script_dir, '../../03-docker-api/app'))
+from feature_cache import cached_training_data
+from hyperparameter_search import DEFAULT_SPACE, describe, sample_trials, search
+from training_data import FOREST_PARAMS, churn_model
+from tree_engine import export_container
+
 print(f"📁 Looking for database at: {db_path}")
 
 # Check if database exists
@@ -30,58 +36,17 @@ if not os.path.exists(db_path):
     print("💡 Please make sure you've run the SQL database creation script first!")
     exit(1)
 
-try:
-    conn = sqlite3.connect(db_path)
-    print("✅ Database connection successful!")
-except Exception as e:
-    print(f"❌ Failed to connect to database: {e}")
-    exit(1)
-
 print("📊 Loading and preparing data...")
 
-# Create a sophisticated query for feature engineering
-query = """
-SELECT 
-    u.user_id,
-    u.country,
-    
-    -- Behavioral Features
-    COUNT(o.order_id) as total_orders,
-    SUM(o.amount) as total_spent,
-    AVG(o.amount) as avg_order_value,
-    JULIANDAY('now') - JULIANDAY(MAX(o.order_date)) as days_since_last_order,
-    COUNT(DISTINCT strftime('%Y-%m', o.order_date)) as active_months,
-    
-    -- Product Diversity
-    COUNT(DISTINCT o.product_id) as unique_products_bought,
-    
-    -- Recent Activity (last 30 days)
-    SUM(CASE WHEN o.order_date >= date('now', '-30 days') THEN 1 ELSE 0 END) as orders_last_30_days,
-    SUM(CASE WHEN o.order_date >= date('now', '-30 days') THEN o.amount ELSE 0 END) as spent_last_30_days,
-    
-    -- Churn Label (90 days without order)
-    CASE WHEN JULIANDAY('now') - JULIANDAY(MAX(o.order_date)) > 90 THEN 1 ELSE 0 END as is_churned
-    
-FROM users u
-LEFT JOIN orders o ON u.user_id = o.user_id
-GROUP BY u.user_id, u.country
-"""
-
-# Load data into pandas
-df = pd.read_sql_query(query, conn)
-conn.close()
-
-print(f"✅ Loaded {len(df)} customers with {df['is_churned'].sum()} churned customers")
-
-# Handle customers with no orders
-df.fillna(0, inplace=True)
-
-# Prepare features and target
-X = df.drop(['user_id', 'is_churned'], axis=1)
-y = df['is_churned']
+# Features come from the trigger-maintained user_features table and are
+# streamed into a compact float32 matrix, already one-hot encoded and with
+# customers without orders filled with 0. Runs against an unchanged database
+# reuse the matrix cached on disk by the first one and skip SQL entirely.
+# Set CHURN_AS_OF=YYYY-MM-DD to train on the features as of a fixed date.
+as_of = os.environ.get('CHURN_AS_OF')
+X, y, from_cache = cached_training_data(db_path, as_of)
 
-# Convert country to numerical (one-hot encoding)
-X = pd.get_dummies(X, columns=['country'], prefix='country')
+print(f"{'⚡ Cached' if from_cache else '✅ Loaded'} {len(X)} customers with {y.sum()} churned customers")
 
 print(f"📈 Using {X.shape[1]} features for prediction")
 
@@ -93,14 +58,21 @@ X_train, X_test, y_train, y_test = train_test_split(
 print(f"📚 Training set: {X_train.shape[0]} samples")
 print(f"🧪 Test set: {X_test.shape[0]} samples")
 
+forest_params = FOREST_PARAMS
+
+# Set CHURN_TUNE_TRIALS=N to cross-validate N sampled forest settings on the
+# training set, one trial per CPU at a time, and train the best one instead
+tune_trials = int(os.environ.get('CHURN_TUNE_TRIALS', '0'))
+if tune_trials:
+    print(f"🔎 Tuning: {tune_trials} trials x 5 folds on {os.cpu_count()} CPUs...")
+    results, seconds = search(X_train, y_train, sample_trials(DEFAULT_SPACE, tune_trials))
+    forest_params = results[0]['params']
+    print(f"   Best ROC AUC {results[0]['mean_score']:.3f} in {seconds:.1f}s "
+          f"({sum(r['pruned'] for r in results)} trials pruned): {describe(forest_params)}")
+
 # Train Random Forest model
 print("🌲 Training Random Forest model...")
-model = RandomForestClassifier(
-    n_estimators=100,
-    max_depth=10,
-    random_state=42,
-    class_weight='balanced'  # Handle imbalanced data
-)
+model = churn_model(forest_params)
 
 model.fit(X_train, y_train)
 
@@ -140,6 +112,10 @@ print(f"\n💾 Model saved to: {model_path}")
 feature_names_path = os.path.join(models_dir, 'feature_names.pkl')
 joblib.dump(list(X.columns), feature_names_path)
 
+# The same forest and feature names as one .forest container, which
+# predict_churn.py loads in milliseconds without sklearn
+print(f"💾 Fast-loading container saved to: {export_container(model_path, feature_names_path)}")
+
 # Create a sample prediction
 sample_customer = X_test.iloc[0:1]
 prediction = model.predict(sample_customer)[0]
@@ -0,0 +1,103 @@
+# feature_cache.py - On-disk cache of the engineered training matrix, keyed by a DB snapshot
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from training_data import NUMERIC_FEATURES, TRAINING_QUERY, load_training_data
+from user_features import FEATURES_QUERY, POINT_IN_TIME_FEATURES_QUERY, as_of_date
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR', os.path.join(script_dir, '../.feature_cache'))
+MAX_ENTRIES = int(os.environ.get('FEATURE_CACHE_ENTRIES', '3'))
+META_FILE = 'meta.json'
+
+def file_signature(path):
+    # A missing file and an empty one (a WAL with nothing to checkpoint, which
+    # SQLite removes when the last connection closes) hold the same data
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def cache_key(db_path, as_of=None):
+    """
+    Fingerprint of the database contents, the feature definition and as_of.
+
+    The database is identified by the size and mtime of its file and of its
+    WAL, which every committed write changes. Features are computed as of a
+    fixed date, so the same snapshot and as_of always give the same matrix.
+    """
+    db_path = os.path.abspath(db_path)
+    parts = [db_path, file_signature(db_path), file_signature(f"{db_path}-wal"),
+             TRAINING_QUERY, FEATURES_QUERY, POINT_IN_TIME_FEATURES_QUERY, ','.join(NUMERIC_FEATURES),
+             as_of_date(as_of)]
+    return hashlib.sha256('\n'.join(str(part) for part in parts).encode()).hexdigest()[:24]
+
+def read_entry(cache_dir, key):
+    """(X, y) memory-mapped from a cache entry, or None on a miss"""
+    path = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        X = np.load(os.path.join(path, 'X.npy'), mmap_mode='r')
+        y = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    # Touching meta.json records the hit for LRU eviction
+    os.utime(os.path.join(path, META_FILE))
+    return pd.DataFrame(X, columns=meta['columns'], copy=False), pd.Series(y, name='is_churned')
+
+def write_entry(cache_dir, key, X, y, **metadata):
+    """Store one entry; built under a temporary name and renamed into place like FlatForest.save"""
+    path = os.path.join(cache_dir, key)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    np.save(os.path.join(tmp_path, 'X.npy'), np.ascontiguousarray(X.to_numpy()))
+    np.save(os.path.join(tmp_path, 'y.npy'), y.to_numpy())
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump({'columns': list(X.columns), 'rows': len(X), **metadata}, f)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another run stored the same snapshot first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def evict(cache_dir, max_entries):
+    """Drop the least recently used entries beyond max_entries"""
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+               if '.tmp-' not in name and os.path.exists(os.path.join(cache_dir, name, META_FILE))]
+    entries.sort(key=lambda path: os.path.getmtime(os.path.join(path, META_FILE)), reverse=True)
+    for path in entries[max_entries:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+def cached_training_data(db_path, as_of=None, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+    """
+    The training set for db_path as of the end of day as_of (today if None),
+    from the cache when this snapshot of the database was loaded for that
+    as_of before. Returns (X, y, from_cache); a hit never opens the database.
+    """
+    as_of = as_of_date(as_of)
+    cached = read_entry(cache_dir, cache_key(db_path, as_of))
+    if cached is not None:
+        return (*cached, True)
+
+    # Read-only: training never changes the schema; without user_features
+    # the feature query aggregates the orders itself
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        # A write that lands during the load leaves this entry under a stale
+        # key that is simply never hit again
+        key = cache_key(db_path, as_of)
+        X, y = load_training_data(conn, as_of)
+    finally:
+        conn.close()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    write_entry(cache_dir, key, X, y, db=os.path.abspath(db_path), as_of=as_of)
+    evict(cache_dir, max_entries)
+    return X, y, False
@@ -0,0 +1,170 @@
+# hyperparameter_search.py - Cross-validated random search over forest hyperparameters on a process pool
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Candidate values per RandomForestClassifier argument; trials sample one of each
+DEFAULT_SPACE = {
+    'n_estimators': [50, 100, 200, 300],
+    'max_depth': [4, 6, 8, 10, 14, None],
+    'min_samples_leaf': [1, 2, 5, 10, 20],
+    'max_features': ['sqrt', 'log2', 0.5, None],
+    'class_weight': [None, 'balanced', 'balanced_subsample'],
+}
+
+# Set in each worker by init_worker: the memory-mapped folds, the best mean
+# score of any finished trial (shared by all workers), the scorer and the margin
+_folds = None
+_best = None
+_scorer = None
+_prune_margin = None
+
+def sample_trials(space, n_trials, seed=42):
+    """n_trials distinct parameter dicts drawn from space"""
+    from sklearn.model_selection import ParameterSampler
+    return list(ParameterSampler(space, n_iter=n_trials, random_state=seed))
+
+def write_folds(X, y, n_folds, folds_dir, seed=42):
+    """
+    Split once into stratified folds and save every fold's train and
+    validation matrices as .npy files, so workers memory-map them instead of
+    each trial gathering its own copies. The page cache holds one copy for all.
+    """
+    from sklearn.model_selection import StratifiedKFold
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    splits = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed).split(X, y)
+    for fold, (train, val) in enumerate(splits):
+        for name, rows in (('train', train), ('val', val)):
+            np.save(os.path.join(folds_dir, f'fold{fold}_X_{name}.npy'), X[rows])
+            np.save(os.path.join(folds_dir, f'fold{fold}_y_{name}.npy'), y[rows])
+
+def load_folds(folds_dir, n_folds):
+    """[(X_train, y_train, X_val, y_val)] memory-mapped read-only from write_folds' files"""
+    def part(fold, name):
+        return np.load(os.path.join(folds_dir, f'fold{fold}_{name}.npy'), mmap_mode='r')
+    return [tuple(part(fold, name) for name in ('X_train', 'y_train', 'X_val', 'y_val'))
+            for fold in range(n_folds)]
+
+def init_worker(folds_dir, n_folds, best, scoring, prune_margin):
+    global _folds, _best, _scorer, _prune_margin
+    from sklearn.metrics import get_scorer
+    _folds = load_folds(folds_dir, n_folds)
+    _best = best
+    _scorer = get_scorer(scoring)
+    _prune_margin = prune_margin
+
+def run_trial(trial, params, seed=42):
+    """
+    Cross-validate one parameter set fold by fold. After the second fold the
+    trial is pruned as soon as its running mean falls more than prune_margin
+    below the best finished trial, so hopeless settings skip their last folds.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    started = time.perf_counter()
+    scores = []
+    pruned = False
+    for fold, (X_train, y_train, X_val, y_val) in enumerate(_folds):
+        # One core per trial: the parallelism is across trials
+        model = RandomForestClassifier(random_state=seed, n_jobs=1, **params).fit(X_train, y_train)
+        scores.append(_scorer(model, X_val, y_val))
+        if fold >= 1 and fold < len(_folds) - 1 and np.mean(scores) < _best.value - _prune_margin:
+            pruned = True
+            break
+    mean = float(np.mean(scores))
+    if not pruned:
+        with _best.get_lock():
+            _best.value = max(_best.value, mean)
+    return {'trial': trial, 'params': params, 'scores': scores, 'mean_score': mean,
+            'pruned': pruned, 'seconds': time.perf_counter() - started}
+
+def search(X, y, trials, n_folds=5, workers=None, scoring='roc_auc', prune_margin=0.02, seed=42,
+           progress=None):
+    """
+    Run every parameter dict in trials through n_folds-fold cross-validation,
+    on a pool of workers processes (in this process when workers is 1).
+    Returns (results sorted best first, pruned last; wall-clock seconds).
+    """
+    workers = workers or os.cpu_count()
+    # Forked workers start at once and do not re-run a calling script that has
+    # no __main__ guard (churn_prediction.py) the way spawned ones would
+    ctx = mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else 'spawn')
+    best = ctx.Value('d', -np.inf)
+    with tempfile.TemporaryDirectory(prefix='churn-folds-') as folds_dir:
+        write_folds(X, y, n_folds, folds_dir, seed)
+        started = time.perf_counter()
+        results = []
+        if workers == 1:
+            init_worker(folds_dir, n_folds, best, scoring, prune_margin)
+            for trial, params in enumerate(trials):
+                results.append(run_trial(trial, params, seed))
+                if progress is not None:
+                    progress(results[-1])
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init_worker,
+                                     initargs=(folds_dir, n_folds, best, scoring, prune_margin)) as pool:
+                futures = [pool.submit(run_trial, trial, params, seed) for trial, params in enumerate(trials)]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    if progress is not None:
+                        progress(results[-1])
+        seconds = time.perf_counter() - started
+    # Ties go to the earlier trial, whatever order the workers finished in
+    results.sort(key=lambda result: (result['pruned'], -result['mean_score'], result['trial']))
+    return results, seconds
+
+def describe(params):
+    return ', '.join(f'{key}={value}' for key, value in sorted(params.items()))
+
+def main():
+    sys.path.insert(0, os.path.join(script_dir, '../../01-sql-foundations/scripts'))
+    from feature_cache import cached_training_data
+
+    parser = argparse.ArgumentParser(description='Cross-validated hyperparameter search for the churn forest')
+    parser.add_argument('--db', default=os.path.join(script_dir, '../../01-sql-foundations/data/ecommerce.db'))
+    parser.add_argument('--as-of', help='features as of this date (default: today)')
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--scoring', default='roc_auc', help='any sklearn scorer name')
+    parser.add_argument('--prune-margin', type=float, default=0.02,
+                        help='stop a trial whose running mean is this far below the best; inf disables')
+    parser.add_argument('--space', help='JSON object of parameter -> candidate values (default: DEFAULT_SPACE)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--compare-serial', action='store_true',
+                        help='run the same trials in one process too and report the speedup')
+    args = parser.parse_args()
+
+    X, y, from_cache = cached_training_data(args.db, args.as_of)
+    trials = sample_trials(json.loads(args.space) if args.space else DEFAULT_SPACE, args.trials, args.seed)
+    print(f"🔎 {len(trials)} trials x {args.folds} folds on {len(X):,} customers "
+          f"({'cached' if from_cache else 'loaded'}), {args.workers} workers, scoring {args.scoring}\n")
+
+    def progress(result):
+        flag = "✂️ " if result['pruned'] else "✅"
+        print(f"   {flag} trial {result['trial']:>3} {result['mean_score']:.4f} "
+              f"({len(result['scores'])} folds, {result['seconds']:.1f}s)  {describe(result['params'])}")
+
+    search_args = (args.folds, args.workers, args.scoring, args.prune_margin, args.seed)
+    results, seconds = search(X, y, trials, *search_args, progress=progress)
+    pruned = sum(result['pruned'] for result in results)
+    print(f"\n🏆 Best {args.scoring} {results[0]['mean_score']:.4f}: {describe(results[0]['params'])}")
+    print(f"   {len(results)} trials in {seconds:.1f}s, {pruned} pruned early")
+
+    if args.compare_serial:
+        serial_args = (args.folds, 1, args.scoring, args.prune_margin, args.seed)
+        _, serial_seconds = search(X, y, trials, *serial_args)
+        print(f"   Serial: {serial_seconds:.1f}s -> {serial_seconds / seconds:.2f}x speedup "
+              f"with {args.workers} workers on {os.cpu_count()} CPUs")
+
+if __name__ == "__main__":
+    main()
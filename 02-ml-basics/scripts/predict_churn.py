@@ -1,85 +1,174 @@
 # predict_churn.py
+import argparse
+import json
 import sqlite3
+import threading
 import pandas as pd
-import joblib
 import numpy as np
 import os
+import sys
 
-def predict_customer_churn(user_id):
-    """Predict churn probability for a specific customer"""
-    
-    # Load the trained model
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(script_dir, '../models/churn_predictor.pkl')
-    feature_names_path = os.path.join(script_dir, '../models/feature_names.pkl')
-    
-    model = joblib.load(model_path)
-    feature_names = joblib.load(feature_names_path)
-    
-    # Get customer data
-    db_path = os.path.join(script_dir, '../../01-sql-foundations/data/ecommerce.db')
-    conn = sqlite3.connect(db_path)
-    
-    query = f"""
-    SELECT 
-        u.user_id,
-        u.country,
-        COUNT(o.order_id) as total_orders,
-        SUM(o.amount) as total_spent,
-        AVG(o.amount) as avg_order_value,
-        JULIANDAY('now') - JULIANDAY(MAX(o.order_date)) as days_since_last_order,
-        COUNT(DISTINCT strftime('%Y-%m', o.order_date)) as active_months,
-        COUNT(DISTINCT o.product_id) as unique_products_bought,
-        SUM(CASE WHEN o.order_date >= date('now', '-30 days') THEN 1 ELSE 0 END) as orders_last_30_days,
-        SUM(CASE WHEN o.order_date >= date('now', '-30 days') THEN o.amount ELSE 0 END) as spent_last_30_days
-    FROM users u
-    LEFT JOIN orders o ON u.user_id = o.user_id
-    WHERE u.user_id = {user_id}
-    GROUP BY u.user_id, u.country
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(script_dir, '../../01-sql-foundations/scripts'))
+from user_features import IDS_FILTER, create_user_features, features_query
+
+# The .forest reader ships with the API; without it models load with joblib
+sys.path.insert(0, os.path.join(script_dir, '../../03-docker-api/app'))
+try:
+    from tree_engine import FlatForest, container_path_for, file_signature
+except ImportError:
+    FlatForest = None
+
+MODEL_PATH = os.path.join(script_dir, '../models/churn_predictor.pkl')
+FEATURE_NAMES_PATH = os.path.join(script_dir, '../models/feature_names.pkl')
+DB_PATH = os.path.join(script_dir, '../../01-sql-foundations/data/ecommerce.db')
+
+class ChurnScorer:
+    """
+    Long-lived churn scorer: loads the model and feature list once, keeps one
+    database connection open and scores any number of users per call with a
+    single predict_proba.
+
+    The database is opened read-only, so the scorer never changes it: with
+    the user_features table (setup_database or --setup) lifetime aggregates
+    are read from it, without it every query aggregates the orders itself.
     """
-    
-    customer_data = pd.read_sql_query(query, conn)
-    conn.close()
-    
-    if customer_data.empty:
-        return f"❌ Customer {user_id} not found!"
-    
-    # Prepare features
-    features = customer_data.drop(['user_id'], axis=1)
-    features = pd.get_dummies(features, columns=['country'], prefix='country')
-    
-    # Ensure all training features are present
-    for feature in feature_names:
-        if feature not in features.columns:
-            features[feature] = 0
-    
-    features = features[feature_names]
-    
-    # Make prediction
-    churn_probability = model.predict_proba(features)[0][1]
+
+    def __init__(self, model_path=MODEL_PATH, feature_names_path=FEATURE_NAMES_PATH, db_path=DB_PATH):
+        self.model, self.feature_names = load_model(model_path, feature_names_path)
+        # Shared across threads; the lock serializes queries on the one connection.
+        # Read-only, so a wrong path fails here instead of creating an empty file
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load_features(self, user_ids=None, as_of=None):
+        """
+        Raw feature rows as of the end of day as_of (today if None) for the given
+        user IDs (all users if None), one row per user found, ordered by user_id.
+        Every call runs one feature query.
+        """
+        with self._lock:
+            if user_ids is None:
+                return pd.read_sql_query(features_query(self.conn, as_of), self.conn)
+
+            # The IDs are bound as one JSON array, as the API does, so any
+            # number of them is one statement with one parameter
+            user_ids = sorted({int(user_id) for user_id in user_ids})
+            return pd.read_sql_query(features_query(self.conn, as_of, where=IDS_FILTER), self.conn,
+                                     params=(json.dumps(user_ids),))
+
+    def feature_matrix(self, user_ids=None, as_of=None):
+        """
+        Bulk feature extraction: (user_ids, features) for every user found, with
+        the features already encoded and in feature_names.pkl column order.
+        """
+        customer_data = self.load_features(user_ids, as_of)
+        return customer_data['user_id'].to_numpy(dtype=np.int64), self.prepare_features(customer_data)
+
+    def prepare_features(self, customer_data):
+        """One-hot encode country and lay the columns out exactly as in training"""
+        features = customer_data.drop(['user_id'], axis=1)
+        features = pd.get_dummies(features, columns=['country'], prefix='country')
+        # Users without orders have NULL aggregates; training filled them with 0 too
+        return features.reindex(columns=self.feature_names, fill_value=0).fillna(0)
+
+    def score(self, user_ids=None, as_of=None):
+        """Predict churn for many users at once; returns {user_id: result} for every user found"""
+        ids, features = self.feature_matrix(user_ids, as_of)
+        if len(ids) == 0:
+            return {}
+
+        probabilities = self.model.predict_proba(features)[:, 1]
+        return {
+            int(user_id): interpret(int(user_id), probability)
+            for user_id, probability in zip(ids, probabilities)
+        }
+
+    def score_one(self, user_id, as_of=None):
+        """Predict churn for one customer, or a not-found message"""
+        result = self.score([user_id], as_of).get(int(user_id))
+        return result if result is not None else f"❌ Customer {user_id} not found!"
+
+def load_model(model_path=MODEL_PATH, feature_names_path=FEATURE_NAMES_PATH):
+    """
+    (model, feature names). A .forest container exported from this very
+    pickle (same size and mtime) is memory-mapped instead of unpickling,
+    which needs neither joblib nor sklearn; so does a .forest model_path.
+    Without the API's tree_engine the pickle is always used.
+    """
+    if FlatForest is not None:
+        container_path = model_path if model_path.endswith('.forest') else container_path_for(model_path)
+        if os.path.exists(container_path):
+            header = FlatForest.read_container_header(container_path)
+            if container_path == model_path or header.get('source') == file_signature(model_path):
+                return FlatForest.load_container(container_path), header['feature_names']
+    import joblib
+    return joblib.load(model_path), joblib.load(feature_names_path)
+
+def interpret(user_id, churn_probability):
+    """Turn a churn probability into the prediction, risk level and recommendation"""
     will_churn = churn_probability > 0.5
-    
+
     # Interpret results
     risk_level = "HIGH" if churn_probability > 0.7 else "MEDIUM" if churn_probability > 0.3 else "LOW"
-    
+
     return {
         'user_id': user_id,
-        'churn_probability': round(churn_probability, 3),
-        'will_churn': will_churn,
+        'churn_probability': round(float(churn_probability), 3),
+        'will_churn': bool(will_churn),
         'risk_level': risk_level,
         'recommendation': "🚨 Offer retention discount" if will_churn else "✅ Continue normal engagement"
     }
 
+def setup_database(db_path=DB_PATH):
+    """Create user_features, its triggers and covering index in db_path, backfilling it once"""
+    conn = sqlite3.connect(db_path)
+    try:
+        create_user_features(conn)
+    finally:
+        conn.close()
+
+_default_scorer = None
+
+def predict_customer_churn(user_id):
+    """Predict churn probability for a specific customer"""
+    global _default_scorer
+    # Loaded on first use and reused by every later call
+    if _default_scorer is None:
+        _default_scorer = ChurnScorer()
+    return _default_scorer.score_one(user_id)
+
 # Test the function
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Predict churn for a few customers')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--setup', action='store_true',
+                        help='create the user_features table and its triggers first (changes the schema, speeds up scoring)')
+    args = parser.parse_args()
+
     print("🔮 Customer Churn Predictor")
     print("=" * 50)
-    
+
+    if args.setup:
+        setup_database(args.db)
+
     # Test with all customers
     test_customers = [1, 2, 3, 4, 5]
-    
+
+    with ChurnScorer(db_path=args.db) as scorer:
+        results = scorer.score(test_customers)
+
     for customer_id in test_customers:
-        result = predict_customer_churn(customer_id)
+        result = results.get(customer_id, f"❌ Customer {customer_id} not found!")
         if isinstance(result, dict):
             print(f"\n👤 Customer {result['user_id']}:")
             print(f"   📊 Churn Probability: {result['churn_probability']}")
@@ -88,6 +177,6 @@ if __name__ == "__main__":
             print(f"   💡 Recommendation: {result['recommendation']}")
         else:
             print(result)
-    
+
     print("\n" + "=" * 50)
-    print("🎉 All predictions completed!")
\ No newline at end of file
+    print("🎉 All predictions completed!")
@@ -0,0 +1,155 @@
+# training_data.py - Stream the labelled churn features into a compact training matrix
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(script_dir, '../../01-sql-foundations/scripts'))
+from user_features import as_of_date, features_query
+
+TRAINING_QUERY = """
+SELECT
+    features.*,
+    -- Churn Label (90 days without order)
+    CASE WHEN days_since_last_order > 90 THEN 1 ELSE 0 END as is_churned
+FROM ({features}) features
+"""
+
+NUMERIC_FEATURES = [
+    'total_orders', 'total_spent', 'avg_order_value', 'days_since_last_order', 'active_months',
+    'unique_products_bought', 'orders_last_30_days', 'spent_last_30_days',
+]
+
+# The forest churn_prediction.py trains, unless CHURN_TUNE_TRIALS picks another
+FOREST_PARAMS = dict(
+    n_estimators=100,
+    max_depth=10,
+    class_weight='balanced'  # Handle imbalanced data
+)
+
+def churn_model(params=None):
+    """An unfitted churn RandomForestClassifier with params (FOREST_PARAMS if None)"""
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(random_state=42, **(FOREST_PARAMS if params is None else params))
+
+def training_query(conn, as_of=None):
+    """The labelled feature query as of the end of day as_of (today if None)"""
+    return TRAINING_QUERY.format(features=features_query(conn, as_of))
+
+def training_columns(countries):
+    """Numeric features, then one country_<name> column per country in sorted order, as get_dummies lays them out"""
+    return NUMERIC_FEATURES + [f'country_{country}' for country in countries]
+
+def encode_into(X, start, frame, countries):
+    """Write the numeric features and one-hot country of frame's rows into X from row start on"""
+    end = start + len(frame)
+    X[start:end, :len(NUMERIC_FEATURES)] = frame[NUMERIC_FEATURES].to_numpy(dtype=np.float32, na_value=0)
+    # Categorical codes index the one-hot columns directly; unknown or NULL
+    # countries (code -1) keep all-zero dummies like get_dummies
+    codes = pd.Categorical(frame['country'], categories=countries).codes
+    known = codes >= 0
+    X[start + np.flatnonzero(known), len(NUMERIC_FEATURES) + codes[known]] = 1
+    return end
+
+def load_training_data(conn, as_of=None, chunksize=20_000, on_chunk=None):
+    """
+    Stream the labelled feature query as of the end of day as_of in chunks into
+    one preallocated float32 matrix. Returns (X, y): X has the columns
+    get_dummies used to produce with missing values as 0, and y is the int8
+    churn label. on_chunk(stage, seconds), if given, is called with the
+    'extraction' time of the setup queries and of each chunk's fetch, and the
+    'encoding' time of each chunk.
+    """
+    def report(stage, started):
+        if on_chunk is not None:
+            on_chunk(stage, time.perf_counter() - started)
+
+    # One read transaction, so the row count and the rows come from the same
+    # snapshot. A transaction the caller already opened is one, and stays theirs
+    owns_transaction = not conn.in_transaction
+    if owns_transaction:
+        conn.execute('BEGIN')
+    try:
+        started = time.perf_counter()
+        countries = sorted(country for (country,) in conn.execute('SELECT DISTINCT country FROM users')
+                           if country is not None)
+        n_rows = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        X = np.zeros((n_rows, len(training_columns(countries))), dtype=np.float32)
+        y = np.zeros(n_rows, dtype=np.int8)
+        chunks = iter(pd.read_sql_query(training_query(conn, as_of), conn, chunksize=chunksize))
+        report('extraction', started)
+
+        start = 0
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            report('extraction', started)
+            if chunk is None:
+                break
+            started = time.perf_counter()
+            y[start:start + len(chunk)] = chunk['is_churned'].to_numpy()
+            start = encode_into(X, start, chunk, countries)
+            report('encoding', started)
+    finally:
+        if owns_transaction:
+            conn.commit()
+
+    X = pd.DataFrame(X[:start], columns=training_columns(countries), copy=False)
+    return X, pd.Series(y[:start], name='is_churned')
+
+def feature_frame(users, orders, as_of=None):
+    """
+    Vectorized equivalent of the SQL feature query: the same rows and values
+    from users (user_id, country) and orders (order_id, user_id, product_id,
+    order_date, amount) frames, with every feature computed in one groupby
+    pass over the orders up to the end of day as_of.
+    """
+    as_of = pd.Timestamp(as_of_date(as_of))
+    # End of the as_of day, the boundary the SQL queries use
+    end = as_of + pd.Timedelta(days=1)
+    # Dates and timestamps may be mixed in one column
+    order_date = pd.to_datetime(orders['order_date'], format='ISO8601')
+    upto = (order_date < end).to_numpy()
+    order_date = order_date[upto]
+    recent = order_date >= as_of - pd.Timedelta(days=30)
+    amount = orders['amount'][upto]
+
+    per_order = pd.DataFrame({
+        'user_id': orders['user_id'][upto],
+        'order_id': orders['order_id'][upto],
+        'product_id': orders['product_id'][upto],
+        'amount': amount,
+        'days_ago': (end - order_date) / pd.Timedelta(days=1),
+        'month': order_date.dt.year * 12 + order_date.dt.month,
+        'recent': recent.astype(np.int64),
+        'recent_amount': amount.where(recent, 0.0),
+    })
+    aggregates = per_order.groupby('user_id').agg(
+        total_orders=('order_id', 'count'),
+        total_spent=('amount', 'sum'),
+        avg_order_value=('amount', 'mean'),
+        days_since_last_order=('days_ago', 'min'),
+        active_months=('month', 'nunique'),
+        unique_products_bought=('product_id', 'nunique'),
+        orders_last_30_days=('recent', 'sum'),
+        spent_last_30_days=('recent_amount', 'sum'),
+    )
+
+    frame = users[['user_id', 'country']].merge(aggregates, how='left', left_on='user_id', right_index=True)
+    # Counts are 0 for users without orders; spend and recency stay NULL as in SQL
+    zero_filled = ['total_orders', 'active_months', 'unique_products_bought',
+                   'orders_last_30_days', 'spent_last_30_days']
+    frame[zero_filled] = frame[zero_filled].fillna(0)
+    return frame.sort_values('user_id', ignore_index=True)
+
+def training_data_from_frames(users, orders, as_of=None):
+    """(X, y) like load_training_data, computed with feature_frame instead of SQL"""
+    frame = feature_frame(users, orders, as_of)
+    countries = sorted(users['country'].dropna().unique())
+    X = np.zeros((len(frame), len(training_columns(countries))), dtype=np.float32)
+    encode_into(X, 0, frame, countries)
+    y = (frame['days_since_last_order'] > 90).to_numpy(dtype=np.int8)
+    return pd.DataFrame(X, columns=training_columns(countries), copy=False), pd.Series(y, name='is_churned')
@@ -0,0 +1,188 @@
+"""
+Adaptive micro-batching for concurrent /predict requests
+
+RandomForestClassifier.predict_proba has a large fixed cost per call, so
+scoring 20 rows in one call is barely slower than scoring one. The
+MicroBatcher queues concurrent requests, scores them as one matrix in a
+worker thread and resolves each caller's future with its own row.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size and queue-delay (ms) buckets in BatchStats
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_DELAY_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100)
+
+# Smoothed batch size above which the batcher holds batches open for the window
+CONCURRENCY_THRESHOLD = 1.5
+
+class BatcherStopped(RuntimeError):
+    """The batcher was stopped, or never started, so the item will not be scored"""
+
+def _bucket_counts(bounds: Sequence[float]) -> List[int]:
+    # One extra slot collects everything above the last bound
+    return [0] * (len(bounds) + 1)
+
+def _observe(bounds: Sequence[float], counts: List[int], value: float) -> None:
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            counts[i] += 1
+            return
+    counts[-1] += 1
+
+class BatchStats:
+    """Counters for the batch-size distribution and queueing delay"""
+
+    def __init__(self):
+        self.batches = 0
+        self.requests = 0
+        self.errors = 0
+        self.batch_size_counts = _bucket_counts(BATCH_SIZE_BUCKETS)
+        self.queue_delay_counts = _bucket_counts(QUEUE_DELAY_BUCKETS_MS)
+        self.queue_delay_total_ms = 0.0
+        self.queue_delay_max_ms = 0.0
+
+    def record_batch(self, size: int) -> None:
+        self.batches += 1
+        self.requests += size
+        _observe(BATCH_SIZE_BUCKETS, self.batch_size_counts, size)
+
+    def record_delay(self, delay_ms: float) -> None:
+        self.queue_delay_total_ms += delay_ms
+        self.queue_delay_max_ms = max(self.queue_delay_max_ms, delay_ms)
+        _observe(QUEUE_DELAY_BUCKETS_MS, self.queue_delay_counts, delay_ms)
+
+    def snapshot(self) -> dict:
+        def labelled(bounds, counts):
+            labels = [f"<={bound}" for bound in bounds] + [f">{bounds[-1]}"]
+            return dict(zip(labels, counts))
+
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_size_distribution": labelled(BATCH_SIZE_BUCKETS, self.batch_size_counts),
+            "queue_delay_ms": {
+                "avg": self.queue_delay_total_ms / self.requests if self.requests else 0.0,
+                "max": self.queue_delay_max_ms,
+                "distribution": labelled(QUEUE_DELAY_BUCKETS_MS, self.queue_delay_counts)
+            }
+        }
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into batches of up to max_batch_size rows.
+
+    The first queued request opens a batch. Whatever else is already waiting is
+    taken immediately; the batcher only holds the batch open for up to
+    window_ms when recent batches show there is concurrent traffic to gather,
+    so a lone request at low load is not delayed by the window.
+
+    score_fn receives the list of queued items and must return one result per
+    item, in order. It runs in the default thread pool so the event loop keeps
+    accepting requests while a batch is being scored.
+    """
+
+    def __init__(self, score_fn: Callable[[List[Any]], Sequence[Any]],
+                 window_ms: float = 2.0, max_batch_size: int = 64):
+        self.score_fn = score_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.stats = BatchStats()
+        # Smoothed batch size; above CONCURRENCY_THRESHOLD requests really are overlapping
+        self._avg_batch_size = 1.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"✅ Micro-batcher started (window={self.window * 1000:.1f}ms, "
+                    f"max_batch_size={self.max_batch_size})")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Nobody will score what is still queued, so fail it rather than hang
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(BatcherStopped("Micro-batcher stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        if not self.running:
+            raise BatcherStopped("Micro-batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self, batch: list) -> None:
+        """Fill batch in place, so items already taken off the queue are known if this is cancelled"""
+        batch.append(await self._queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.window if self._avg_batch_size > CONCURRENCY_THRESHOLD else 0.0)
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    def _fail(self, batch: list, error: BaseException) -> None:
+        for _, future, _ in batch:
+            # The caller may have disconnected and cancelled its future
+            if not future.done():
+                future.set_exception(error)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            try:
+                await self._collect(batch)
+                items = [item for item, _, _ in batch]
+
+                started = time.perf_counter()
+                for _, _, enqueued in batch:
+                    self.stats.record_delay((started - enqueued) * 1000)
+                self.stats.record_batch(len(batch))
+                self._avg_batch_size = 0.8 * self._avg_batch_size + 0.2 * len(batch)
+
+                try:
+                    results = await loop.run_in_executor(None, self.score_fn, items)
+                except Exception as e:
+                    self.stats.errors += 1
+                    logger.error(f"Micro-batch of {len(batch)} failed: {e}")
+                    self._fail(batch, e)
+                    continue
+            except BaseException:
+                # Cancelled by stop() while collecting or scoring: these requests
+                # are off the queue, so stop() cannot fail them
+                self._fail(batch, BatcherStopped("Micro-batcher stopped"))
+                raise
+
+            for (_, future, _), result in zip(batch, results):
+                # The caller may have disconnected and cancelled its future
+                if not future.done():
+                    future.set_result(result)
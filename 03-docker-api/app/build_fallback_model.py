@@ -0,0 +1,43 @@
+# build_fallback_model.py - Prebuild the model the API falls back to when churn_predictor.pkl won't load
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from tree_engine import FlatForest
+
+FALLBACK_DIR = 'fallback_model.flat'
+
+def build_fallback_model(models_path='models'):
+    """Train a small forest on synthetic customers and save it as a FlatForest artifact"""
+    np.random.seed(42)
+    n_samples = 1000
+
+    df = pd.DataFrame({
+        'age': np.random.randint(18, 70, n_samples),
+        'tenure': np.random.randint(1, 60, n_samples),
+        'monthly_charges': np.random.uniform(20, 100, n_samples),
+        'total_charges': np.random.uniform(50, 5000, n_samples),
+        'contract_type': np.random.choice(['Monthly', 'Yearly', 'Two-year'], n_samples),
+        'support_calls': np.random.randint(0, 10, n_samples)
+    })
+    churn_prob = (df['support_calls'] > 5).astype(int) * 0.6 + \
+                 (df['monthly_charges'] > 70).astype(int) * 0.4
+    y = (churn_prob + np.random.normal(0, 0.1, n_samples) > 0.5).astype(int)
+    X = pd.get_dummies(df, columns=['contract_type'])
+
+    model = RandomForestClassifier(n_estimators=20, max_depth=8, random_state=42)
+    model.fit(X, y)
+
+    # Stored in the FlatForest format so loading it needs neither sklearn nor joblib
+    path = os.path.join(models_path, FALLBACK_DIR)
+    shutil.rmtree(path, ignore_errors=True)
+    FlatForest.from_sklearn(model).save(path, feature_names=list(X.columns))
+    return path
+
+if __name__ == "__main__":
+    path = build_fallback_model(*sys.argv[1:])
+    print(f"✅ Fallback model saved to {path}")
@@ -0,0 +1,177 @@
+"""
+Streaming bulk scoring of CSV / NDJSON uploads
+
+The upload is consumed chunk by chunk as it arrives, encoded into one reused
+(chunk_rows, n_features) matrix, scored, and written back as NDJSON before
+the next chunk is read. Memory therefore depends on chunk_rows, not on how
+many rows the file holds.
+"""
+import csv
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from starlette.responses import StreamingResponse
+
+from feature_encoder import FEATURE_DTYPE, FeatureEncoder
+
+FORMATS = ('csv', 'ndjson')
+
+# Longest line an upload may contain: a file without newlines would otherwise
+# be buffered whole while waiting for its first row to end
+MAX_LINE_BYTES = 1 << 20
+
+class LineTooLong(ValueError):
+    """An upload line exceeds the line length limit"""
+
+class UploadStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for bodies produced while the upload is still being read.
+
+    The stock StreamingResponse listens for client disconnects by calling
+    receive() in parallel, which swallows the request body chunks that
+    request.stream() is waiting for. Here only the request body reads from
+    receive(), and a client disconnect surfaces there as ClientDisconnect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    """Map a request Content-Type to 'csv' or 'ndjson'"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl',
+                        'application/json-lines', 'application/x-jsonlines'):
+        return 'ndjson'
+    return None
+
+def _decode(line: bytes) -> Union[str, UnicodeDecodeError]:
+    try:
+        return line.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return e
+
+async def iter_lines(chunks: AsyncIterator[bytes],
+                     max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[Union[str, UnicodeDecodeError]]:
+    """
+    Split a stream of byte chunks into decoded lines, skipping blank ones. A
+    line that is not valid UTF-8 is yielded as its UnicodeDecodeError, so it
+    becomes that row's error instead of ending the stream. A line longer than
+    max_line_bytes raises LineTooLong rather than being buffered.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        # Bytes already in the buffer hold no newline: only the new chunk is
+        # searched, so a line split over many chunks is scanned once
+        scan = len(buffer)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b'\n', scan)
+            if end < 0:
+                break
+            if end - start > max_line_bytes:
+                raise LineTooLong(f"line longer than {max_line_bytes} bytes")
+            line = bytes(buffer[start:end]).rstrip(b'\r')
+            if line:
+                yield _decode(line)
+            start = scan = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise LineTooLong(f"line longer than {max_line_bytes} bytes")
+    if buffer.strip():
+        yield _decode(bytes(buffer).rstrip(b'\r'))
+
+async def iter_records(lines: AsyncIterator[Union[str, UnicodeDecodeError]],
+                       fmt: str) -> AsyncIterator[Tuple[Optional[Dict], Optional[str]]]:
+    """Yield (record, None) per data line, or (None, error) for lines that do not parse"""
+    header = None
+    async for line in lines:
+        if isinstance(line, UnicodeDecodeError):
+            yield None, f"invalid UTF-8: {line}"
+        elif fmt == 'csv':
+            # One record per physical line: quoted fields may not contain newlines
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                yield None, f"expected {len(header)} columns, got {len(values)}"
+            else:
+                yield dict(zip(header, values)), None
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield None, f"invalid JSON: {e}"
+                continue
+            if isinstance(record, dict):
+                yield record, None
+            else:
+                yield None, "each NDJSON line must be a JSON object"
+
+def _result_lines(rows: List[Tuple[int, object, Optional[str]]], labels, probabilities) -> Iterator[str]:
+    scored = iter(zip(labels, probabilities))
+    for row_number, row_id, error in rows:
+        result = {"row": row_number}
+        if row_id is not None:
+            result["id"] = row_id
+        if error is None:
+            label, probability = next(scored)
+            result["churn_prediction"] = bool(label)
+            result["churn_probability"] = float(probability)
+        else:
+            result["error"] = error
+        yield json.dumps(result)
+
+async def score_stream(chunks: AsyncIterator[bytes], fmt: str, encoder: FeatureEncoder,
+                       score_matrix: Callable[[np.ndarray], Awaitable[Tuple]],
+                       chunk_rows: int = 5000, id_field: str = 'customer_id',
+                       max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[bytes]:
+    """
+    Score an uploaded CSV/NDJSON stream and yield NDJSON result lines.
+
+    Every input row produces exactly one output line, in input order, carrying
+    its 1-based row number, the id_field value when present, and either the
+    prediction or an error. score_matrix is awaited once per chunk. Raises
+    LineTooLong on a line longer than max_line_bytes.
+    """
+    matrix = np.zeros((chunk_rows, encoder.n_features), dtype=FEATURE_DTYPE)
+    # (row number, id, error) for every row of the current chunk, valid or not
+    rows: List[Tuple[int, object, Optional[str]]] = []
+    n_valid = 0
+    row_number = 0
+
+    async def flush():
+        if n_valid:
+            labels, probabilities = await score_matrix(matrix[:n_valid])
+        else:
+            labels, probabilities = (), ()
+        body = '\n'.join(_result_lines(rows, labels, probabilities))
+        return (body + '\n').encode('utf-8')
+
+    async for record, error in iter_records(iter_lines(chunks, max_line_bytes), fmt):
+        row_number += 1
+        row_id = record.get(id_field) if record is not None else None
+        if error is None:
+            row = matrix[n_valid]
+            row.fill(0)
+            try:
+                encoder.fill_record(row, record)
+                n_valid += 1
+            except KeyError as e:
+                error = f"missing field {e}"
+            except (TypeError, ValueError) as e:
+                error = str(e)
+        rows.append((row_number, row_id, error))
+
+        if n_valid == chunk_rows or len(rows) >= 2 * chunk_rows:
+            yield await flush()
+            rows, n_valid = [], 0
+
+    if rows:
+        yield await flush()
@@ -0,0 +1,100 @@
+"""
+Precompiled feature encoder for the churn API
+
+Replaces the per-request pd.DataFrame + pd.get_dummies + reindex dance with a
+column map built once from feature_names.pkl.
+"""
+import math
+import threading
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+# RandomForestClassifier casts its input to float32, so encoding straight into
+# float32 lets sklearn use our buffer without another copy
+FEATURE_DTYPE = np.float32
+
+class FeatureEncoder:
+    """
+    Maps CustomerData fields onto the training column layout.
+
+    Numeric fields are copied to their column offset; categorical fields set the
+    matching one-hot column (e.g. contract_type='Monthly' -> contract_type_Monthly).
+    Unknown categories and columns the payload does not provide stay 0, exactly
+    like the pd.get_dummies + "add missing columns" code this replaces.
+    """
+
+    def __init__(self, feature_names: Sequence[str], fields: Iterable[str],
+                 categorical_fields: Iterable[str] = ('contract_type',)):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+
+        column_index = {name: i for i, name in enumerate(self.feature_names)}
+        categorical_fields = list(categorical_fields)
+
+        # (field, column) pairs for values copied as-is
+        self.numeric_columns = [
+            (field, column_index[field])
+            for field in fields
+            if field in column_index and field not in categorical_fields
+        ]
+
+        # field -> {category value: column} for one-hot encoded fields
+        self.category_columns: Dict[str, Dict[str, int]] = {}
+        for field in categorical_fields:
+            prefix = f"{field}_"
+            self.category_columns[field] = {
+                name[len(prefix):]: i
+                for name, i in column_index.items()
+                if name.startswith(prefix)
+            }
+
+        self._local = threading.local()
+
+    def _fill_row(self, row: np.ndarray, customer) -> None:
+        for field, column in self.numeric_columns:
+            row[column] = getattr(customer, field)
+        for field, categories in self.category_columns.items():
+            column = categories.get(getattr(customer, field))
+            if column is not None:
+                row[column] = 1
+
+    def fill_record(self, row: np.ndarray, record: Dict) -> None:
+        """
+        Write a raw dict record (e.g. a parsed CSV or NDJSON line) into row.
+
+        Values may still be strings, so numeric fields go through float().
+        Raises KeyError for a missing field and ValueError/TypeError for a value
+        that is not a finite number; row may be partially written in that case.
+        """
+        for field, column in self.numeric_columns:
+            value = float(record[field])
+            if not math.isfinite(value):
+                raise ValueError(f"{field} must be a finite number, got {record[field]!r}")
+            row[column] = value
+        for field, categories in self.category_columns.items():
+            column = categories.get(str(record[field]))
+            if column is not None:
+                row[column] = 1
+
+    def encode_one(self, customer) -> np.ndarray:
+        """
+        Encode a single customer into a (1, n_features) matrix.
+
+        The returned array is a per-thread buffer that is reused by the next
+        encode_one call on the same thread, so score it before encoding again.
+        """
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.zeros((1, self.n_features), dtype=FEATURE_DTYPE)
+        else:
+            row.fill(0)
+        self._fill_row(row[0], customer)
+        return row
+
+    def encode_many(self, customers: List) -> np.ndarray:
+        """Encode a list of customers into a fresh (n, n_features) matrix"""
+        matrix = np.zeros((len(customers), self.n_features), dtype=FEATURE_DTYPE)
+        for row, customer in zip(matrix, customers):
+            self._fill_row(row, customer)
+        return matrix
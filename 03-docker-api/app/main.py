@@ -1,20 +1,122 @@
-from fastapi import FastAPI, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from contextlib import contextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-import joblib
-import pandas as pd
-import numpy as np
+from typing import List, Optional, Union
+from datetime import date
+import asyncio
+import hmac
+import json
 import os
 import logging
+import threading
+import warnings
+
+from batching import BatcherStopped, MicroBatcher
+from bulk_scoring import FORMATS, MAX_LINE_BYTES, LineTooLong, UploadStreamingResponse, detect_format, score_stream
+from feature_encoder import FeatureEncoder
+from metrics import MetricsMiddleware, PredictionMetrics
+from model_bundle import ModelBundle, file_version
+from prediction_cache import PredictionCache
+from process_memory import process_memory, process_uptime
+from tree_engine import FlatForest, container_path_for, export_flat_model
+from user_store import PoolTimeout, SQLitePool, UserFeatureEncoder, features_query, fetch_user_features, interpret
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The encoder hands sklearn plain arrays already in feature_names order, so the
+# "fitted with feature names" warning on every call is just noise
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
 app = FastAPI(title="Churn Prediction API", version="1.0.0")
 
-# Global variables for model and features
-model = None
-feature_names = None
+# Stage latency histograms, in-flight gauge and model load time, served on /metrics
+metrics = PredictionMetrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# "debug" logs the container layout and trains a toy model if loading fails;
+# "production" skips both to get to the first request as fast as possible
+STARTUP_MODE = os.getenv("STARTUP_MODE", "debug").lower()
+
+# Prebuilt by build_fallback_model.py; served when churn_predictor.pkl will not load
+FALLBACK_MODEL_DIR = 'fallback_model.flat'
+
+# Milliseconds spent in each startup stage, served on /startup
+startup_timings = {"imports_ms": round((time.perf_counter() - _import_started) * 1000, 2)}
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[f"{stage}_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+# The model version currently being served. Replaced as a whole on reload;
+# handlers read it once so in-flight requests finish on the version they started with.
+bundle = None
+_reload_lock = threading.Lock()
+
+# Seconds between checks of the models directory for a new model; 0 disables the watcher
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+watcher_task = None
+
+# Token /admin/reload expects in the X-Admin-Token header. Unset, the endpoint
+# is open in debug mode and disabled in production
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# "sklearn" scores with the unpickled model, "native" with the flattened tree engine
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "sklearn").lower()
+
+# "joblib" unpickles a private copy of the forest per worker; "mmap" serves a
+# FlatForest whose arrays are memory-mapped read-only and shared by all workers;
+# "forest" maps churn_predictor.forest (forest and feature names in one file,
+# see tree_engine.export_container) and never imports joblib or sklearn
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "joblib").lower()
+
+# Worker memory around load_model(), reported on /debug/memory
+memory_before_load = None
+memory_after_load = None
+
+# Upper bound on rows accepted by a single /predict/batch call
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+
+# Rows encoded and scored at a time by the streaming /predict/stream endpoint
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "5000"))
+# Longest CSV / NDJSON line /predict/stream accepts; longer ones get a 413
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(MAX_LINE_BYTES)))
+
+# Micro-batching of concurrent single-row /predict requests
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS", "2"))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+batcher = None
+
+# LRU + TTL cache of /predict results; PREDICTION_CACHE_SIZE=0 disables it
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "300"))
+prediction_cache = (PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+                    if PREDICTION_CACHE_SIZE > 0 else None)
+
+# Ecommerce database and churn model (02-ml-basics/models) behind GET /predict/{user_id}
+# and POST /predict/batch with user IDs; ID scoring stays off unless both exist
+_repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..')
+ECOMMERCE_DB_PATH = os.getenv("ECOMMERCE_DB_PATH",
+                              os.path.join(_repo_dir, '01-sql-foundations/data/ecommerce.db'))
+USER_MODEL_DIR = os.getenv("USER_MODEL_DIR", os.path.join(_repo_dir, '02-ml-basics/models'))
+
+# Read-only connections (one thread each) shared by the ID endpoints, and the
+# seconds a request waits for a free one before a 503
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+user_bundle = None
+db_pool = None
 
 class CustomerData(BaseModel):
     age: int
@@ -24,10 +126,59 @@ class CustomerData(BaseModel):
     contract_type: str
     support_calls: int
 
+def models_dir():
+    return '/app/models' if os.path.exists('/app/models') else './models'
+
+def model_files(models_path):
+    model_path = os.path.join(models_path, 'churn_predictor.pkl')
+    if MODEL_LOAD_MODE == "forest":
+        # The container holds the feature names too
+        return container_path_for(model_path), container_path_for(model_path)
+    return model_path, os.path.join(models_path, 'feature_names.pkl')
+
 def load_model():
     """Load the model and feature names with comprehensive debugging"""
-    global model, feature_names
+    global memory_before_load, memory_after_load
+    
+    memory_before_load = process_memory()
+    models_path = models_dir()
+    if STARTUP_MODE != "production":
+        with timed("directory_listing"):
+            log_container_layout(models_path)
+    
+    # Try to load model
+    model_path, features_path = model_files(models_path)
+    
+    logger.info(f"Model path: {model_path}")
+    logger.info(f"Features path: {features_path}")
+    
+    try:
+        if not os.path.exists(model_path):
+            logger.error(f"❌ Model file not found: {model_path}")
+        elif not os.path.exists(features_path):
+            logger.error(f"❌ Features file not found: {features_path}")
+        else:
+            logger.info("✅ Model and features files exist")
+            with timed("model_load"):
+                new_bundle = load_bundle(models_path)
+            with timed("warm_up"):
+                install_bundle(new_bundle)
+            logger.info(f"✅ Model loaded successfully! (mode: {MODEL_LOAD_MODE}, version: {new_bundle.version})")
+            logger.info(f"✅ Features loaded: {new_bundle.feature_names}")
+            
+    except Exception as e:
+        logger.error(f"❌ Error loading model/features: {e}")
+        with timed("fallback"):
+            fallback = load_fallback_bundle(models_path)
+            if fallback is not None:
+                install_bundle(fallback)
     
+    memory_after_load = process_memory()
+    logger.info(f"📊 Worker {memory_after_load['pid']} RSS: {memory_before_load['rss_mb']} MB -> "
+                f"{memory_after_load['rss_mb']} MB (PSS {memory_after_load['pss_mb']} MB)")
+
+def log_container_layout(models_path):
+    """Debug: log the working, app and models directories"""
     logger.info("🔍 STARTING MODEL LOAD DEBUGGING")
     
     # Debug: Current directory and files
@@ -47,7 +198,6 @@ def load_model():
             logger.info(f"  {item_type} {item}")
     
     # Debug: Check models directory
-    models_path = '/app/models' if os.path.exists('/app/models') else './models'
     logger.info(f"Models path: {models_path}")
     
     if os.path.exists(models_path):
@@ -59,71 +209,332 @@ def load_model():
             logger.info(f"  {item_type} {item} ({size} bytes)")
     else:
         logger.error(f"❌ Models directory does not exist: {models_path}")
+
+def load_fallback_bundle(models_path):
+    """The prebuilt fallback model if the image has one; in debug mode, a freshly trained toy model"""
+    fallback_path = os.path.join(models_path, FALLBACK_MODEL_DIR)
+    if os.path.isdir(fallback_path):
+        logger.info(f"🔄 Loading prebuilt fallback model from {fallback_path}")
+        names = FlatForest.read_meta(fallback_path)['feature_names']
+        return make_bundle(FlatForest.load(fallback_path), names, version="fallback")
     
-    # Try to load model
-    model_path = os.path.join(models_path, 'churn_predictor.pkl')
-    features_path = os.path.join(models_path, 'feature_names.pkl')
+    if STARTUP_MODE == "production":
+        logger.error(f"❌ No prebuilt fallback model at {fallback_path}; serving without a model")
+        return None
     
-    logger.info(f"Model path: {model_path}")
-    logger.info(f"Features path: {features_path}")
+    # Create fallback model for testing
+    logger.info("🔄 Creating fallback model for testing...")
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.datasets import make_classification
     
+    fallback_features = ['age', 'tenure', 'monthly_charges', 'total_charges', 
+                         'support_calls', 'contract_type_Monthly', 'contract_type_Yearly', 'contract_type_Two-year']
+    X, y = make_classification(n_samples=100, n_features=len(fallback_features), random_state=42)
+    fallback_model = RandomForestClassifier(n_estimators=10, random_state=42)
+    fallback_model.fit(X, y)
+    logger.info("✅ Fallback model created for testing")
+    return make_bundle(fallback_model, fallback_features, version="fallback")
+
+def make_bundle(fitted_model, names, version, source=None):
+    """Wrap a loaded model and its feature names in a ready-to-serve ModelBundle"""
+    encoder = build_encoder(names)
+    logger.info(f"✅ Feature encoder compiled for {encoder.n_features} columns")
+    return ModelBundle(model=fitted_model, predictor=build_predictor(fitted_model),
+                       feature_names=names, encoder=encoder, version=version, source=source)
+
+def load_bundle(models_path):
+    """Load churn_predictor.pkl + feature_names.pkl from models_path without touching the live model"""
+    model_path, features_path = model_files(models_path)
+    # Read the signature first so a file replaced mid-load is picked up again next time
+    source = files_signature(models_path)
+    started = time.perf_counter()
+    fitted_model = load_model_file(model_path)
+    names = load_feature_names(features_path)
+    metrics.record_model_load(time.perf_counter() - started)
+    return make_bundle(fitted_model, names, version=model_version(model_path), source=source)
+
+def install_bundle(new_bundle):
+    """Warm a bundle up, then make it the one new requests are served with"""
+    global bundle
+    new_bundle.warm_up()
+    bundle = new_bundle
+    if prediction_cache is not None:
+        prediction_cache.set_model_version(new_bundle.version)
+
+def reload_model(force=False):
+    """
+    Load the models directory again and atomically swap it in.
+    
+    The old bundle keeps serving until the new one is loaded and warmed; a
+    failed load leaves it in place. Returns the old and new versions.
+    """
+    with _reload_lock:
+        old_version = bundle.version if bundle is not None else None
+        new_bundle = load_bundle(models_dir())
+        if new_bundle.version == old_version and not force:
+            # Same content (e.g. only touched); just remember the new signature
+            bundle.source = new_bundle.source
+            return {"reloaded": False, "old_version": old_version, "new_version": old_version}
+        install_bundle(new_bundle)
+        logger.info(f"🔄 Model hot-reloaded: {old_version} -> {new_bundle.version}")
+        return {"reloaded": True, "old_version": old_version, "new_version": new_bundle.version}
+
+def files_signature(models_path):
+    """Size and mtime of the model files; cheap to poll, changes whenever they are rewritten"""
+    signature = []
+    for path in model_files(models_path):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+async def watch_models():
+    """Reload when the model files change and then stay unchanged for one interval"""
+    last_seen = None
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        signature = files_signature(models_dir())
+        current = bundle
+        if current is not None and signature == current.source:
+            last_seen = signature
+            continue
+        if signature != last_seen or None in signature:
+            # Still being written (or missing); check again next interval
+            last_seen = signature
+            continue
+        try:
+            await run_in_threadpool(reload_model)
+        except Exception as e:
+            logger.error(f"❌ Hot reload failed, still serving {current.version if current else None}: {e}")
+            # Do not retry the same broken files every interval
+            if current is not None:
+                current.source = signature
+
+def load_model_file(model_path):
+    """Load churn_predictor.pkl the way MODEL_LOAD_MODE asks for"""
+    if MODEL_LOAD_MODE == "forest":
+        return FlatForest.load_container(model_path, mmap_mode='r')
+    if MODEL_LOAD_MODE == "mmap":
+        # Normally exported at build time; the first worker exports it otherwise
+        flat_path = export_flat_model(model_path)
+        return FlatForest.load(flat_path, mmap_mode='r')
+    if MODEL_LOAD_MODE != "joblib":
+        logger.warning(f"⚠️ Unknown MODEL_LOAD_MODE '{MODEL_LOAD_MODE}', using joblib")
+    # Imported here so the mmap mode never pays for joblib (or the sklearn it unpickles)
+    import joblib
+    return joblib.load(model_path)
+
+def model_version(model_path):
+    """
+    The version reported on /model and X-Model-Version. A container carries the
+    version of the pickle it was exported from, the one in versions/history.jsonl;
+    anything else is versioned by its own content hash.
+    """
+    if MODEL_LOAD_MODE == "forest":
+        version = FlatForest.read_container_header(model_path).get('version')
+        if version is not None:
+            return version
+    return file_version(model_path)
+
+def load_feature_names(features_path):
+    if MODEL_LOAD_MODE == "forest":
+        return FlatForest.read_container_header(features_path)['feature_names']
+    import joblib
+    return joblib.load(features_path)
+
+def build_predictor(fitted_model):
+    """Pick the inference engine selected by INFERENCE_ENGINE for a loaded model"""
+    if isinstance(fitted_model, FlatForest):
+        # Memory-mapped models are already in native form
+        return fitted_model
+    if INFERENCE_ENGINE == "native":
+        forest = FlatForest.from_sklearn(fitted_model)
+        logger.info(f"✅ Native tree engine: {forest.n_trees} trees, {forest.n_nodes} nodes, "
+                    f"max depth {forest.max_depth}")
+        return forest
+    if INFERENCE_ENGINE != "sklearn":
+        logger.warning(f"⚠️ Unknown INFERENCE_ENGINE '{INFERENCE_ENGINE}', using sklearn")
+    return fitted_model
+
+def build_encoder(names):
+    """Compile the CustomerData -> feature row mapping for the given training columns"""
+    return FeatureEncoder(names, fields=CustomerData.model_fields.keys())
+
+def load_user_bundle(models_path):
+    """The ecommerce churn model in models_path as a ModelBundle over features_query rows"""
+    model_path, features_path = model_files(models_path)
+    fitted_model = load_model_file(model_path)
+    names = load_feature_names(features_path)
+    user_bundle = ModelBundle(model=fitted_model, predictor=build_predictor(fitted_model),
+                              feature_names=names, encoder=UserFeatureEncoder(names),
+                              version=model_version(model_path))
+    user_bundle.warm_up()
+    return user_bundle
+
+async def start_user_scoring():
+    """Load the ecommerce model and open the connection pool, if both are configured"""
+    global user_bundle, db_pool
+    model_path, features_path = model_files(USER_MODEL_DIR)
+    missing = [path for path in (ECOMMERCE_DB_PATH, model_path, features_path) if not os.path.exists(path)]
+    if missing:
+        logger.warning(f"⚠️ Scoring by user ID disabled, not found: {missing}")
+        return
+    if features_query is None:
+        logger.warning("⚠️ Scoring by user ID disabled: 01-sql-foundations/scripts/user_features.py not found")
+        return
     try:
-        if os.path.exists(model_path):
-            logger.info(f"✅ Model file exists: {model_path}")
-            model = joblib.load(model_path)
-            logger.info("✅ Model loaded successfully!")
-        else:
-            logger.error(f"❌ Model file not found: {model_path}")
-            
-        if os.path.exists(features_path):
-            logger.info(f"✅ Features file exists: {features_path}")
-            feature_names = joblib.load(features_path)
-            logger.info(f"✅ Features loaded: {feature_names}")
-        else:
-            logger.error(f"❌ Features file not found: {features_path}")
-            
+        new_bundle = await run_in_threadpool(load_user_bundle, USER_MODEL_DIR)
+        pool = SQLitePool(ECOMMERCE_DB_PATH, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+        await pool.open()
     except Exception as e:
-        logger.error(f"❌ Error loading model/features: {e}")
-        # Create fallback model for testing
-        logger.info("🔄 Creating fallback model for testing...")
-        from sklearn.ensemble import RandomForestClassifier
-        from sklearn.datasets import make_classification
-        
-        X, y = make_classification(n_samples=100, n_features=6, random_state=42)
-        model = RandomForestClassifier(n_estimators=10, random_state=42)
-        model.fit(X, y)
-        feature_names = ['age', 'tenure', 'monthly_charges', 'total_charges', 
-                        'support_calls', 'contract_type_Monthly', 'contract_type_Yearly', 'contract_type_Two-year']
-        logger.info("✅ Fallback model created for testing")
+        logger.error(f"❌ Scoring by user ID disabled: {e}")
+        return
+    user_bundle, db_pool = new_bundle, pool
+    logger.info(f"✅ Scoring by user ID from {ECOMMERCE_DB_PATH} "
+                f"({DB_POOL_SIZE} connections, model {new_bundle.version})")
+
+def score_timed(current, encode, customers):
+    """Encode then score with the given bundle, timing both stages for /metrics"""
+    started = time.perf_counter()
+    features = encode(customers)
+    encoded = time.perf_counter()
+    labels, probabilities = current.score_matrix(features)
+    metrics.observe('encoding', encoded - started)
+    metrics.observe('inference', time.perf_counter() - encoded)
+    return labels, probabilities
+
+def score_customers(customers):
+    """Score queued customers as one matrix; returns (label, probability, bundle that scored it) each"""
+    current = bundle
+    labels, probabilities = score_timed(current, current.encoder.encode_many, customers)
+    return [(label, probability, current)
+            for label, probability in zip(labels, probabilities)]
+
+def score_one(current, customer):
+    """Score a single customer with the given bundle; returns (label, probability)"""
+    labels, probabilities = score_timed(current, current.encoder.encode_one, customer)
+    return labels[0], probabilities[0]
+
+async def score_user_ids(user_ids):
+    """
+    Score ecommerce users by ID with one feature query and one predict_proba call.
+    
+    Returns ({user_id: prediction} for the IDs found, model version).
+    """
+    current, pool = user_bundle, db_pool
+    if current is None or pool is None:
+        raise HTTPException(status_code=503,
+                            detail="Scoring by user ID needs ECOMMERCE_DB_PATH and USER_MODEL_DIR")
+    
+    started = time.perf_counter()
+    try:
+        rows = await pool.run(fetch_user_features, list(dict.fromkeys(user_ids)), date.today().isoformat())
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    metrics.observe('feature_lookup', time.perf_counter() - started)
+    
+    if not rows:
+        return {}, current.version
+    _, probabilities = await run_in_threadpool(score_timed, current, current.encoder.encode_rows, rows)
+    return {row[0]: interpret(row[0], probability) for row, probability in zip(rows, probabilities)}, current.version
 
 @app.on_event("startup")
 async def startup_event():
     """Load model on startup"""
-    logger.info("🚀 Starting up Churn Prediction API...")
-    load_model()
+    global batcher
+    logger.info(f"🚀 Starting up Churn Prediction API ({STARTUP_MODE} mode)...")
+    startup_started = time.perf_counter()
+    with timed("load_model"):
+        load_model()
+    with timed("user_scoring"):
+        await start_user_scoring()
+    
+    if MICROBATCH_ENABLED:
+        with timed("batcher_start"):
+            batcher = MicroBatcher(score_customers, window_ms=MICROBATCH_WINDOW_MS,
+                                   max_batch_size=MICROBATCH_MAX_SIZE)
+            await batcher.start()
+    
+    startup_timings["startup_event_ms"] = round((time.perf_counter() - startup_started) * 1000, 2)
+    # Includes interpreter and server boot before main.py was imported
+    uptime = process_uptime()
+    if uptime is not None:
+        startup_timings["process_start_to_ready_ms"] = round(uptime * 1000, 2)
+    logger.info(f"⏱️ Startup breakdown: {startup_timings}")
+    
+    if MODEL_WATCH_INTERVAL > 0:
+        global watcher_task
+        watcher_task = asyncio.create_task(watch_models())
+        logger.info(f"👀 Watching {models_dir()} for new models every {MODEL_WATCH_INTERVAL}s")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the micro-batcher so queued requests fail fast instead of hanging"""
+    if watcher_task is not None:
+        watcher_task.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    if db_pool is not None:
+        db_pool.close()
 
 @app.get("/")
 def read_root():
     return {
         "message": "Churn Prediction API is running!",
-        "model_loaded": model is not None,
-        "features_loaded": feature_names is not None
+        "model_loaded": bundle is not None,
+        "features_loaded": bundle is not None
     }
 
 @app.get("/health")
 def health_check():
+    current = bundle
     return {
-        "status": "healthy" if model is not None else "degraded",
-        "model_loaded": model is not None,
-        "features_loaded": feature_names is not None
+        "status": "healthy" if current is not None else "degraded",
+        "model_loaded": current is not None,
+        "features_loaded": current is not None,
+        "model_version": current.version if current is not None else None,
+        "inference_engine": current.engine if current is not None else None
     }
 
+@app.get("/model")
+def model_info():
+    """Which model version is being served, and since when"""
+    current = bundle
+    if current is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    return {
+        "model_version": current.version,
+        "loaded_at": current.loaded_at,
+        "inference_engine": current.engine,
+        "features": current.feature_names,
+        "watch_interval_seconds": MODEL_WATCH_INTERVAL
+    }
+
+def check_admin_token(token):
+    if not ADMIN_TOKEN:
+        if STARTUP_MODE == "production":
+            raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+        return
+    if token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or wrong X-Admin-Token")
+
+@app.post("/admin/reload")
+async def admin_reload(force: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """Load and warm the model files in the background, then swap them in atomically"""
+    check_admin_token(x_admin_token)
+    try:
+        return await run_in_threadpool(reload_model, force)
+    except Exception as e:
+        logger.error(f"❌ Hot reload failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Reload failed, previous model still serving: {e}")
+
 @app.get("/debug")
 def debug_info():
     """Endpoint to get debug information"""
-    models_path = '/app/models' if os.path.exists('/app/models') else './models'
-    model_path = os.path.join(models_path, 'churn_predictor.pkl')
-    features_path = os.path.join(models_path, 'feature_names.pkl')
+    models_path = models_dir()
+    model_path, features_path = model_files(models_path)
     
     return {
         "current_directory": os.getcwd(),
@@ -131,8 +542,8 @@ def debug_info():
         "models_directory_exists": os.path.exists(models_path),
         "model_file_exists": os.path.exists(model_path),
         "features_file_exists": os.path.exists(features_path),
-        "model_loaded": model is not None,
-        "features_loaded": feature_names is not None,
+        "model_loaded": bundle is not None,
+        "features_loaded": bundle is not None,
         "container_files": {
             "root": os.listdir('/') if os.path.exists('/') else [],
             "app": os.listdir('/app') if os.path.exists('/app') else [],
@@ -140,38 +551,207 @@ def debug_info():
         }
     }
 
+@app.get("/startup")
+def startup_info():
+    """Where the cold start went, to track startup-time regressions"""
+    return {"startup_mode": STARTUP_MODE, "timings": startup_timings}
+
+@app.get("/debug/memory")
+def memory_info():
+    """Memory of the worker serving this request, before and after model load"""
+    return {
+        "model_load_mode": MODEL_LOAD_MODE,
+        "before_load": memory_before_load,
+        "after_load": memory_after_load,
+        "current": process_memory()
+    }
+
+@app.get("/stats/db")
+def db_pool_stats():
+    """Size and idle connections of the ID endpoints' database pool"""
+    if db_pool is None:
+        return {"enabled": False}
+    return {"enabled": True, "path": ECOMMERCE_DB_PATH, **db_pool.stats()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss/eviction counters of the /predict result cache"""
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Stage latency histograms, in-flight requests and model load time for Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/batching")
+def batching_stats():
+    """Batch-size distribution and queueing delay of the /predict micro-batcher"""
+    return {
+        "enabled": batcher is not None,
+        "window_ms": MICROBATCH_WINDOW_MS,
+        "max_batch_size": MICROBATCH_MAX_SIZE,
+        **(batcher.stats.snapshot() if batcher is not None else {})
+    }
+
 @app.post("/predict")
-def predict_churn(customer: CustomerData):
-    if model is None or feature_names is None:
+async def predict_churn(customer: CustomerData):
+    current = bundle
+    if current is None:
         raise HTTPException(status_code=503, detail="Model not loaded yet")
     
+    metrics.handler_started()
     try:
-        # Convert to DataFrame
-        input_data = pd.DataFrame([customer.dict()])
-        
-        # One-hot encoding for contract_type
-        input_processed = pd.get_dummies(input_data)
+        cached = None
+        if prediction_cache is not None:
+            cached = prediction_cache.get(prediction_cache.make_key(customer, current.version))
         
-        # Ensure all expected columns are present
-        for col in feature_names:
-            if col not in input_processed.columns:
-                input_processed[col] = 0
-        
-        # Reorder columns to match training
-        input_processed = input_processed[feature_names]
-        
-        prediction = model.predict(input_processed)[0]
-        probability = model.predict_proba(input_processed)[0][1]
+        # A hot reload can swap the bundle while the request waits in the
+        # batcher, so report the features and version of the one that scored it
+        scored_by = current
+        if cached is not None:
+            prediction, probability = cached
+        else:
+            if batcher is not None:
+                prediction, probability, scored_by = await batcher.submit(customer)
+            else:
+                prediction, probability = await run_in_threadpool(score_one, current, customer)
+            if prediction_cache is not None:
+                prediction_cache.put(prediction_cache.make_key(customer, scored_by.version),
+                                     (bool(prediction), float(probability)))
         
         return {
             "churn_prediction": bool(prediction),
             "churn_probability": float(probability),
             "customer_data": customer.dict(),
-            "features_used": feature_names
+            "features_used": scored_by.feature_names,
+            "model_version": scored_by.version
         }
+    except BatcherStopped as e:
+        # Shutting down: the request was valid, the server just cannot score it now
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        metrics.handler_finished()
+
+@app.get("/predict/{user_id}")
+async def predict_user(user_id: int):
+    """Score one ecommerce user, with features read from the database"""
+    results, version = await score_user_ids([user_id])
+    if user_id not in results:
+        raise HTTPException(status_code=404, detail=f"Customer {user_id} not found")
+    return {**results[user_id], "model_version": version}
+
+@app.post("/predict/batch")
+async def predict_batch(payload: Union[List[CustomerData], List[int]]):
+    """Score a list of CustomerData payloads, or a list of ecommerce user IDs"""
+    if payload and isinstance(payload[0], int):
+        return await predict_user_batch(payload)
+    return await run_in_threadpool(predict_churn_batch, payload)
+
+async def predict_user_batch(user_ids: List[int]):
+    """Score ecommerce users by ID in request order; unknown IDs get an error entry"""
+    if len(user_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(user_ids)} exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}"
+        )
+    results, version = await score_user_ids(user_ids)
+    predictions = [results.get(user_id, {"user_id": user_id, "error": "Customer not found"})
+                   for user_id in user_ids]
+    return {"predictions": predictions, "total_processed": len(predictions), "model_version": version}
+
+def predict_churn_batch(customers: List[CustomerData]):
+    """Score many customers with one feature matrix and one predict_proba call"""
+    current = bundle
+    if current is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    
+    if len(customers) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(customers)} exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}"
+        )
+    
+    if not customers:
+        return {"predictions": [], "total_processed": 0, "model_version": current.version}
+    
+    try:
+        features = current.encoder.encode_many(customers)
+        labels, churn_probabilities = current.score_matrix(features)
+        
+        predictions = [
+            {
+                "churn_prediction": bool(label),
+                "churn_probability": float(probability)
+            }
+            for label, probability in zip(labels, churn_probabilities)
+        ]
+        
+        return {
+            "predictions": predictions,
+            "total_processed": len(predictions),
+            "features_used": current.feature_names,
+            "model_version": current.version
+        }
+    except Exception as e:
+        logger.error(f"Batch prediction error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/predict/stream")
+async def predict_churn_stream(request: Request,
+                               fmt: Optional[str] = Query(None, alias="format"),
+                               id_field: str = "customer_id"):
+    """
+    Score a streamed CSV or NDJSON upload and stream NDJSON results back.
+    
+    The format comes from ?format=csv|ndjson or the Content-Type header. Rows are
+    parsed, encoded and scored STREAM_CHUNK_ROWS at a time, so memory stays flat
+    whatever the file size. Each input row yields one result line with its row
+    number, the id_field value if present, and a prediction or an error. The
+    whole upload is scored by the model version named in X-Model-Version. A
+    line over STREAM_MAX_LINE_BYTES is a 413, or a final error line once
+    results have started.
+    """
+    current = bundle
+    if current is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    
+    fmt = (fmt or detect_format(request.headers.get("content-type")) or "").lower()
+    if fmt not in FORMATS:
+        raise HTTPException(
+            status_code=415,
+            detail="Upload text/csv or application/x-ndjson, or pass ?format=csv|ndjson"
+        )
+    
+    async def score(features):
+        return await run_in_threadpool(current.score_matrix, features)
+    
+    results = score_stream(request.stream(), fmt, current.encoder, score, chunk_rows=STREAM_CHUNK_ROWS,
+                           id_field=id_field, max_line_bytes=STREAM_MAX_LINE_BYTES)
+    # Score the first chunk before answering, so an oversized line near the
+    # top of the upload is still a clean 413
+    try:
+        first = await results.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except LineTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    async def body():
+        yield first
+        try:
+            async for part in results:
+                yield part
+        except LineTooLong as e:
+            # The 200 is already sent: end the results with the error instead
+            yield (json.dumps({"error": str(e)}) + "\n").encode("utf-8")
+    
+    return UploadStreamingResponse(body(), media_type="application/x-ndjson",
+                                   headers={"X-Model-Version": str(current.version)})
 
 if __name__ == "__main__":
     import uvicorn
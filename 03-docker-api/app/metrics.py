@@ -0,0 +1,160 @@
+"""
+Per-stage latency histograms for /predict, served in Prometheus text format
+
+A /predict request is split into four stages:
+  validation     - request received until the handler runs (body read, JSON
+                   parse, pydantic validation, routing)
+  encoding       - CustomerData -> feature matrix
+  inference      - predict_proba
+  serialization  - handler returned until the response headers go out
+
+The ID endpoints also record feature_lookup, the wait for a pooled database
+connection plus the feature query.
+
+Encoding and inference are observed once per scoring call, so with the
+micro-batcher on one observation covers a whole batch. Recording an
+observation is a bisect into fixed buckets plus two additions under a lock.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from typing import List, Optional, Sequence, Tuple
+
+STAGES = ('validation', 'feature_lookup', 'encoding', 'inference', 'serialization')
+
+# Upper bounds in seconds, from 25us to 1s
+LATENCY_BUCKETS = (0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class Histogram:
+    """Fixed-bucket histogram; counts are per bucket, cumulated only when rendered"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One extra slot collects everything above the last bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+class RequestTimer:
+    """Timestamps of one instrumented request, shared by the middleware and the handler"""
+    __slots__ = ('started', 'handler_done')
+
+    def __init__(self, started: float):
+        self.started = started
+        self.handler_done: Optional[float] = None
+
+# Set by MetricsMiddleware for the request being handled; None outside of one (e.g. in tests)
+current_request: contextvars.ContextVar[Optional[RequestTimer]] = \
+    contextvars.ContextVar('current_request', default=None)
+
+class PredictionMetrics:
+    """Stage histograms, in-flight gauge and model load time of the API"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.stages = {stage: Histogram(buckets) for stage in STAGES}
+        self.in_flight = 0
+        self.model_load_seconds: Optional[float] = None
+        self.model_loads = 0
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.stages[stage].observe(seconds)
+
+    def handler_started(self) -> None:
+        """Called first thing in the handler: closes the validation stage"""
+        timer = current_request.get()
+        if timer is not None:
+            self.stages['validation'].observe(time.perf_counter() - timer.started)
+
+    def handler_finished(self) -> None:
+        """Called as the handler returns: opens the serialization stage"""
+        timer = current_request.get()
+        if timer is not None:
+            timer.handler_done = time.perf_counter()
+
+    def record_model_load(self, seconds: float) -> None:
+        self.model_load_seconds = seconds
+        self.model_loads += 1
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP churn_predict_stage_seconds Time spent in each stage of /predict.",
+            "# TYPE churn_predict_stage_seconds histogram"
+        ]
+        for stage, histogram in self.stages.items():
+            counts, total = histogram.snapshot()
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, counts):
+                cumulative += count
+                lines.append(f'churn_predict_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'churn_predict_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(f'churn_predict_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'churn_predict_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+
+        lines += [
+            "# HELP churn_requests_in_flight Prediction requests currently being handled.",
+            "# TYPE churn_requests_in_flight gauge",
+            f"churn_requests_in_flight {self.in_flight}",
+            "# HELP churn_model_loads_total Models loaded from disk since startup, reloads included.",
+            "# TYPE churn_model_loads_total counter",
+            f"churn_model_loads_total {self.model_loads}"
+        ]
+        if self.model_load_seconds is not None:
+            lines += [
+                "# HELP churn_model_load_seconds Time the most recent model load from disk took.",
+                "# TYPE churn_model_load_seconds gauge",
+                f"churn_model_load_seconds {self.model_load_seconds}"
+            ]
+        return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware tracking in-flight requests and the stage timestamps
+    of the prediction paths; other requests pass straight through.
+
+    Written against raw ASGI rather than BaseHTTPMiddleware, which would add a
+    task and a memory stream to every request.
+    """
+
+    def __init__(self, app, metrics: PredictionMetrics, paths: Sequence[str] = ('/predict',)):
+        self.app = app
+        self.metrics = metrics
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        timer = RequestTimer(time.perf_counter())
+        token = current_request.set(timer)
+
+        async def send_timed(message):
+            if message['type'] == 'http.response.start' and timer.handler_done is not None:
+                metrics.observe('serialization', time.perf_counter() - timer.handler_done)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            current_request.reset(token)
+            metrics.in_flight -= 1
@@ -0,0 +1,53 @@
+"""
+A loaded model version and everything needed to serve it
+
+main.py keeps exactly one current ModelBundle and replaces it with a single
+assignment on hot reload. Request handlers grab the current bundle once at the
+start and use only that object, so requests already in flight finish on the
+version they started with while new requests see the new one.
+"""
+import hashlib
+import time
+
+import numpy as np
+
+def file_version(path):
+    """Short content hash of a model file, identical across workers and hosts"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+class ModelBundle:
+    """Model, inference engine, feature layout and version, swapped in as one unit"""
+
+    def __init__(self, model, predictor, feature_names, encoder, version, source=None):
+        self.model = model
+        # What predict_proba is called on: the sklearn model or its FlatForest
+        self.predictor = predictor
+        self.feature_names = feature_names
+        self.encoder = encoder
+        self.version = version
+        # Size/mtime signature of the files it was loaded from, for the reload watcher
+        self.source = source
+        self.loaded_at = time.time()
+
+    @property
+    def engine(self) -> str:
+        return type(self.predictor).__name__
+
+    def score_matrix(self, features):
+        """Return (labels, churn probabilities) from a single predict_proba call"""
+        probabilities = self.predictor.predict_proba(features)
+        labels = self.predictor.classes_[probabilities.argmax(axis=1)]
+        return labels, probabilities[:, 1]
+
+    def warm_up(self, rows: int = 8) -> None:
+        """
+        Run a throwaway prediction before the bundle takes traffic.
+
+        This pages in the model (and a memory-mapped FlatForest's files) and
+        fails the reload early if the model and feature list do not fit together.
+        """
+        self.score_matrix(np.zeros((rows, self.encoder.n_features), dtype=np.float32))
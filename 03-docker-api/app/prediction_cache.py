@@ -0,0 +1,91 @@
+"""
+In-process LRU + TTL cache of churn predictions
+
+Callers re-score the same customer profiles within minutes, so a hit skips
+feature encoding and model inference entirely. Entries are keyed on the
+validated CustomerData values plus the model version, and the whole cache is
+dropped when a different model version is installed.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+class PredictionCache:
+    """Bounded, thread-safe LRU cache whose entries expire after ttl_seconds"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.model_version: Optional[str] = None
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(customer, model_version: Optional[str]) -> Tuple:
+        """
+        Canonical key for a validated CustomerData scored by model_version.
+
+        Pydantic has already coerced every field to its declared type, so the
+        field values in declaration order identify the profile; the model
+        version makes entries from an older model unreachable.
+        """
+        return (model_version,) + tuple(customer.__dict__.values())
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def set_model_version(self, version: Optional[str]) -> None:
+        """Switch to a new model version, dropping every cached prediction"""
+        if version != self.model_version:
+            self.clear()
+            self.model_version = version
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model_version": self.model_version,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
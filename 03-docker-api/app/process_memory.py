@@ -0,0 +1,52 @@
+"""
+Per-process memory and uptime readings from /proc
+
+RSS alone double-counts pages shared between workers (a memory-mapped model
+shows up in every worker's RSS), so we also report the anonymous/file split
+and PSS, which divides each shared page between the processes mapping it.
+"""
+import os
+from typing import Dict, Optional
+
+def _read_kb_fields(path: str, fields) -> Dict[str, int]:
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in fields:
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """Return rss/anon/file/shmem/pss in MB for a process (default: this one)"""
+    proc = f"/proc/{pid or 'self'}"
+    status = _read_kb_fields(f"{proc}/status", ('VmRSS', 'RssAnon', 'RssFile', 'RssShmem'))
+    rollup = _read_kb_fields(f"{proc}/smaps_rollup", ('Pss',))
+
+    def mb(kb):
+        return round(kb / 1024, 2) if kb is not None else None
+
+    return {
+        "pid": pid or os.getpid(),
+        "rss_mb": mb(status.get('VmRSS')),
+        "rss_anon_mb": mb(status.get('RssAnon')),
+        "rss_file_mb": mb(status.get('RssFile')),
+        "rss_shmem_mb": mb(status.get('RssShmem')),
+        "pss_mb": mb(rollup.get('Pss'))
+    }
+
+def process_uptime() -> Optional[float]:
+    """Seconds since this process started, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces, so count fields after its ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            system_uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    started_after_boot = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    return system_uptime - started_after_boot
@@ -0,0 +1,416 @@
+"""
+Flattened tree-ensemble inference engine
+
+Converts a fitted RandomForestClassifier into a handful of contiguous NumPy
+arrays once at load time and then walks every tree for every row of a batch
+with vectorized gathers. For the small batches the API sees this avoids
+sklearn's per-call overhead (input validation, joblib dispatch, one Python
+call per tree), which costs far more than the tree walks themselves.
+
+A FlatForest is stored either as a directory of .npy files (save / load) or
+as a single .forest container (save_container / load_container): a JSON
+header followed by the raw arrays. Both load in milliseconds, can be
+memory-mapped, and need neither sklearn nor joblib.
+"""
+import heapq
+import json
+import os
+import shutil
+import struct
+
+import numpy as np
+
+# sklearn casts inputs to float32 before comparing them to the float64 split
+# thresholds, so we do the same to land on exactly the same side of every split
+INPUT_DTYPE = np.float32
+
+# Arrays written by FlatForest.save, one .npy file each
+ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+META_FILE = 'meta.json'
+
+# .forest container: magic, header length (little-endian uint32), JSON header,
+# then every array padded to ARRAY_ALIGNMENT bytes so each one is aligned in a
+# memory map. The header gives each array's dtype, shape and offset from the
+# start of the array data.
+CONTAINER_MAGIC = b'FLATFRST'
+CONTAINER_VERSION = 1
+ARRAY_ALIGNMENT = 64
+_PREFIX = struct.Struct('<8sI')
+
+def _aligned(n):
+    return -(-n // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+def _round_down(threshold, dtype):
+    """
+    Thresholds as dtype, rounded toward -inf.
+
+    Inputs are float32, and for a float32 x, x <= t exactly when x is <= the
+    largest float32 not above t, so float32 thresholds rounded this way send
+    every row down the same branch as the float64 originals.
+    """
+    cast = threshold.astype(dtype)
+    over = cast > threshold
+    cast[over] = np.nextafter(cast[over], dtype(-np.inf))
+    return cast
+
+def _prune(tree, max_depth=None, max_leaf_nodes=None):
+    """
+    Node ids of a fitted sklearn tree to keep, in preorder, with a mask of
+    the ones that stay splits, and the depth of the pruned tree.
+
+    This cuts the existing tree back; it does not regrow it. A node stays a
+    split while it is above max_depth. With max_leaf_nodes, the splits that
+    remove the most weighted impurity are kept first. Every other kept node
+    becomes a leaf predicting the class distribution of the training samples
+    that reached it. The surviving splits are the original ones, chosen
+    without the limits, so the result generally differs from a tree trained
+    with max_depth / max_leaf_nodes.
+    """
+    if max_depth is None and max_leaf_nodes is None:
+        return np.arange(tree.node_count), tree.children_left != -1, tree.max_depth
+
+    left, right = tree.children_left, tree.children_right
+    weighted, impurity = tree.weighted_n_node_samples, tree.impurity
+
+    def gain(node):
+        return (weighted[node] * impurity[node] - weighted[left[node]] * impurity[left[node]]
+                - weighted[right[node]] * impurity[right[node]])
+
+    def splittable(node, depth):
+        return left[node] != -1 and (max_depth is None or depth < max_depth)
+
+    splits = set()
+    candidates = [(-gain(0), 0, 0)] if splittable(0, 0) else []
+    n_leaves = 1
+    while candidates and (max_leaf_nodes is None or n_leaves < max_leaf_nodes):
+        _, node, depth = heapq.heappop(candidates)
+        splits.add(node)
+        n_leaves += 1
+        for child in (left[node], right[node]):
+            if splittable(child, depth + 1):
+                heapq.heappush(candidates, (-gain(child), child, depth + 1))
+
+    nodes, depths, stack = [], [], [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        nodes.append(node)
+        depths.append(depth)
+        if node in splits:
+            stack.append((right[node], depth + 1))
+            stack.append((left[node], depth + 1))
+    nodes = np.array(nodes)
+    return nodes, np.isin(nodes, list(splits)), max(depths)
+
+class FlatForest:
+    """
+    All trees of a forest packed into shared node arrays.
+
+    Node i of the packed forest splits on feature[i] at threshold[i] and moves
+    to left[i] when x[feature[i]] <= threshold[i], otherwise to right[i]. Leaves
+    point back to themselves (left[i] == i), which is also how the walk knows a
+    row has arrived. value[i] holds the class distribution of node i, already
+    normalised the way DecisionTreeClassifier.predict_proba does.
+
+    The walk is vectorized over rows and trees, which beats sklearn by an order
+    of magnitude for the one-to-few-row batches the API scores; for batches in
+    the thousands sklearn's multithreaded Cython walk wins again.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, classes, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model, n_trees=None, max_depth=None, max_leaf_nodes=None,
+                     dtype=np.float64) -> "FlatForest":
+        """
+        Pack a fitted RandomForestClassifier (single output) into flat arrays.
+
+        The optional arguments build a compacted forest: only the first n_trees
+        trees, each cut back to max_depth and max_leaf_nodes (see _prune), with
+        thresholds and class distributions stored as dtype.
+        """
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError("FlatForest only supports single-output classifiers")
+
+        # The trees of a forest are exchangeable, so the first n are as good as any n
+        trees = [estimator.tree_ for estimator in model.estimators_[:n_trees]]
+
+        roots, features, thresholds, lefts, rights, values, depths = [], [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            nodes, is_split, depth = _prune(tree, max_depth, max_leaf_nodes)
+            new_ids = np.zeros(tree.node_count, dtype=np.int32)
+            new_ids[nodes] = np.arange(len(nodes), dtype=np.int32) + offset
+            node_ids = new_ids[nodes]
+
+            # Leaves test feature 0 against an arbitrary threshold and go nowhere
+            features.append(np.where(is_split, tree.feature[nodes], 0).astype(np.int32))
+            thresholds.append(np.where(is_split, tree.threshold[nodes], 0.0))
+            lefts.append(np.where(is_split, new_ids[tree.children_left[nodes]], node_ids))
+            rights.append(np.where(is_split, new_ids[tree.children_right[nodes]], node_ids))
+
+            value = tree.value[nodes, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+            roots.append(offset)
+            depths.append(depth)
+            offset += len(nodes)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(_round_down(np.concatenate(thresholds), dtype)),
+            left=np.ascontiguousarray(np.concatenate(lefts)),
+            right=np.ascontiguousarray(np.concatenate(rights)),
+            value=np.ascontiguousarray(np.concatenate(values).astype(dtype)),
+            roots=np.array(roots, dtype=np.int32),
+            classes=np.asarray(model.classes_),
+            max_depth=max(depths),
+            n_features=model.n_features_in_
+        )
+
+    def save(self, path: str, **metadata) -> None:
+        """
+        Write the forest as a directory of .npy files plus meta.json.
+
+        The directory is built under a temporary name and renamed into place, so
+        workers starting at the same time never see a half-written artifact.
+        Extra keyword arguments are stored in meta.json (e.g. the source model).
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+
+        meta = {
+            'classes': self.classes_.tolist(),
+            'max_depth': self.max_depth,
+            'n_features': self.n_features_in_,
+            **metadata
+        }
+        with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another worker got there first; its copy is just as good
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+
+    def save_container(self, path: str, **metadata) -> None:
+        """
+        Write the forest as one .forest container (see CONTAINER_MAGIC).
+
+        Extra keyword arguments go into the header, e.g. feature_names. The file
+        is written under a temporary name and renamed over path, so a reader
+        sees either the old container or the new one.
+        """
+        arrays, offset = {}, 0
+        for name in ARRAY_NAMES:
+            array = np.ascontiguousarray(getattr(self, name))
+            # Explicit byte order, so a container reads the same on any host
+            array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+            offset = _aligned(offset)
+            arrays[name] = (array, {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+            offset += array.nbytes
+
+        header = json.dumps({
+            'format_version': CONTAINER_VERSION,
+            'classes': self.classes_.tolist(),
+            'max_depth': self.max_depth,
+            'n_features': self.n_features_in_,
+            'arrays': {name: entry for name, (_, entry) in arrays.items()},
+            **metadata
+        }).encode()
+        # Pad the header with spaces so the array data starts aligned
+        header += b' ' * (_aligned(_PREFIX.size + len(header)) - _PREFIX.size - len(header))
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(_PREFIX.pack(CONTAINER_MAGIC, len(header)))
+            f.write(header)
+            data_start = f.tell()
+            for array, entry in arrays.values():
+                f.write(b'\0' * (data_start + entry['offset'] - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read_container_header(path: str) -> dict:
+        """The JSON header of a .forest container, plus data_start: where its arrays begin"""
+        with open(path, 'rb') as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size or _PREFIX.unpack(prefix)[0] != CONTAINER_MAGIC:
+                raise ValueError(f"{path} is not a .forest container")
+            header_length = _PREFIX.unpack(prefix)[1]
+            header = json.loads(f.read(header_length))
+        if header.get('format_version') != CONTAINER_VERSION:
+            raise ValueError(f"{path} is .forest format version {header.get('format_version')}, "
+                             f"this engine reads version {CONTAINER_VERSION}")
+        header['data_start'] = _PREFIX.size + header_length
+        return header
+
+    @classmethod
+    def load_container(cls, path: str, mmap_mode: str = 'r') -> "FlatForest":
+        """
+        Load a forest written by save_container().
+
+        With mmap_mode='r' the whole file is mapped once and every node array is a
+        read-only view into it, shared by all worker processes through the page
+        cache; with None it is read into private memory in one call.
+        """
+        header = cls.read_container_header(path)
+        if mmap_mode is None:
+            buffer = np.fromfile(path, dtype=np.uint8)
+        else:
+            buffer = np.memmap(path, dtype=np.uint8, mode=mmap_mode)
+        arrays = {}
+        for name in ARRAY_NAMES:
+            entry = header['arrays'][name]
+            dtype = np.dtype(entry['dtype'])
+            start = header['data_start'] + entry['offset']
+            count = int(np.prod(entry['shape']))
+            arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+        return cls(
+            classes=np.asarray(header['classes']),
+            max_depth=header['max_depth'],
+            n_features=header['n_features'],
+            **arrays
+        )
+
+    @staticmethod
+    def read_meta(path: str) -> dict:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = 'r') -> "FlatForest":
+        """
+        Load a forest written by save().
+
+        With the default mmap_mode='r' the node arrays are read-only views of the
+        files, so every worker process on the host shares one copy through the
+        page cache instead of holding a private unpickled forest.
+        """
+        meta = cls.read_meta(path)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(
+            classes=np.asarray(meta['classes']),
+            max_depth=meta['max_depth'],
+            n_features=meta['n_features'],
+            **arrays
+        )
+
+    def apply(self, X) -> np.ndarray:
+        """Return the (n_samples, n_trees) matrix of leaf node ids reached by each row"""
+        X = np.asarray(X, dtype=INPUT_DTYPE)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input with {self.n_features_in_} features, got shape {X.shape}")
+
+        n_samples, n_features = X.shape
+        flat_X = np.ascontiguousarray(X).ravel()
+
+        # One walker per (row, tree) pair, row-major so the result reshapes to (rows, trees)
+        nodes = np.tile(self.roots, n_samples)
+        row_offsets = np.repeat(np.arange(n_samples) * n_features, self.n_trees)
+
+        # Only keep walking pairs that have not reached a leaf yet; most leaves
+        # sit well above max_depth, so the active set shrinks quickly
+        active = np.arange(nodes.size)
+        current = nodes
+        while current.size:
+            go_left = flat_X[row_offsets + self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = current
+
+            still_walking = self.left[current] != current
+            if not still_walking.all():
+                active = active[still_walking]
+                current = current[still_walking]
+                row_offsets = row_offsets[still_walking]
+
+        return nodes.reshape(n_samples, self.n_trees)
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Average of the per-tree leaf class distributions, like RandomForestClassifier"""
+        return self.value[self.apply(X)].mean(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+def flat_path_for(model_path: str) -> str:
+    """models/churn_predictor.pkl -> models/churn_predictor.flat"""
+    return os.path.splitext(model_path)[0] + '.flat'
+
+def container_path_for(model_path: str) -> str:
+    """models/churn_predictor.pkl -> models/churn_predictor.forest"""
+    return os.path.splitext(model_path)[0] + '.forest'
+
+def file_signature(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def export_flat_model(model_path: str) -> str:
+    """
+    Make sure an up-to-date FlatForest artifact exists next to a joblib model.
+
+    The artifact records the size and mtime of the pickle it came from and is
+    rebuilt when the pickle changes. Returns the artifact path.
+    """
+    flat_path = flat_path_for(model_path)
+    source = file_signature(model_path)
+    if os.path.isdir(flat_path):
+        if FlatForest.read_meta(flat_path).get('source') == source:
+            return flat_path
+        # Workers that already mapped the old files keep them until they exit
+        shutil.rmtree(flat_path, ignore_errors=True)
+
+    # Only a rebuild needs joblib (and the sklearn it unpickles)
+    import joblib
+    FlatForest.from_sklearn(joblib.load(model_path)).save(flat_path, source=source)
+    return flat_path
+
+def export_container(model_path: str, feature_names_path: str = None) -> str:
+    """
+    Write the .forest container of a joblib model next to it, with the
+    feature names (feature_names.pkl in the same directory by default), the
+    size and mtime of the pickle and its version in the header. Returns the
+    container path.
+    """
+    import joblib
+    from model_bundle import file_version
+    feature_names_path = feature_names_path or os.path.join(os.path.dirname(model_path), 'feature_names.pkl')
+    path = container_path_for(model_path)
+    FlatForest.from_sklearn(joblib.load(model_path)).save_container(
+        path, feature_names=list(joblib.load(feature_names_path)), source=file_signature(model_path),
+        version=file_version(model_path))
+    return path
+
+if __name__ == "__main__":
+    # Export at image build time so no worker has to unpickle the forest:
+    #   python tree_engine.py models/churn_predictor.pkl
+    import sys
+
+    for path in sys.argv[1:] or ['models/churn_predictor.pkl']:
+        print(f"✅ {path} -> {export_flat_model(path)}, {export_container(path)}")
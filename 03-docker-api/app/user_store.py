@@ -0,0 +1,152 @@
+"""
+Ecommerce user features for the ID-based /predict endpoints
+
+GET /predict/{user_id} and POST /predict/batch with a list of user IDs score
+customers of the ecommerce database instead of a posted feature payload. A
+whole batch of IDs is read with one query through SQLitePool, a fixed set of
+read-only sqlite3 connections with one worker thread each, so a blocking
+sqlite3 call never runs on the event loop and a burst of requests queues for
+a connection instead of opening more.
+
+The feature SQL is features_query from 01-sql-foundations/scripts/user_features.py,
+the same one predict_churn.py and training use: lifetime aggregates from the
+trigger-maintained user_features table, or one pass over orders when scoring
+as of an earlier date.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from feature_encoder import FEATURE_DTYPE
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../01-sql-foundations/scripts'))
+try:
+    from user_features import IDS_FILTER, features_query, has_user_features
+except ImportError:
+    # The image ships app/ only; scoring by ID then stays off (see main.start_user_scoring)
+    IDS_FILTER = features_query = has_user_features = None
+
+# Columns of features_query after user_id and country, in order
+NUMERIC_FEATURES = [
+    'total_orders', 'total_spent', 'avg_order_value', 'days_since_last_order', 'active_months',
+    'unique_products_bought', 'orders_last_30_days', 'spent_last_30_days',
+]
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool timeout"""
+
+def fetch_user_features(conn: sqlite3.Connection, user_ids: Sequence[int], as_of: str) -> List[tuple]:
+    """Feature rows (user_id, country, *NUMERIC_FEATURES) as of the end of day as_of of the user_ids found"""
+    return conn.execute(features_query(conn, as_of, where=IDS_FILTER), (json.dumps(list(user_ids)),)).fetchall()
+
+def interpret(user_id: int, churn_probability: float) -> Dict:
+    """Prediction, risk level and recommendation for a churn probability, as predict_churn.py reports them"""
+    will_churn = churn_probability > 0.5
+    risk_level = "HIGH" if churn_probability > 0.7 else "MEDIUM" if churn_probability > 0.3 else "LOW"
+    return {
+        "user_id": user_id,
+        "churn_probability": round(float(churn_probability), 3),
+        "will_churn": bool(will_churn),
+        "risk_level": risk_level,
+        "recommendation": "🚨 Offer retention discount" if will_churn else "✅ Continue normal engagement"
+    }
+
+class UserFeatureEncoder:
+    """
+    Maps features_query rows onto the ecommerce model's training columns.
+
+    Numeric features are copied to their column with NULL as 0 and country sets
+    its country_<name> column, matching the fillna + get_dummies + reindex of
+    predict_churn.py; unknown countries keep all-zero dummies.
+    """
+
+    def __init__(self, feature_names: Sequence[str]):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        column_index = {name: i for i, name in enumerate(self.feature_names)}
+        # Positions in NUMERIC_FEATURES of the features the model uses, and their columns
+        used = [name for name in NUMERIC_FEATURES if name in column_index]
+        self.numeric_positions = [NUMERIC_FEATURES.index(name) for name in used]
+        self.numeric_columns = [column_index[name] for name in used]
+        self.country_columns = {name[len('country_'):]: i for name, i in column_index.items()
+                                if name.startswith('country_')}
+
+    def encode_rows(self, rows: Sequence[tuple]) -> np.ndarray:
+        """Encode feature rows into a fresh (n, n_features) matrix"""
+        matrix = np.zeros((len(rows), self.n_features), dtype=FEATURE_DTYPE)
+        if not rows:
+            return matrix
+        # None becomes NaN in a float array, then 0
+        numeric = np.array([row[2:] for row in rows], dtype=np.float64)
+        matrix[:, self.numeric_columns] = np.nan_to_num(numeric[:, self.numeric_positions], nan=0.0)
+        for row, (_, country, *_rest) in zip(matrix, rows):
+            column = self.country_columns.get(country)
+            if column is not None:
+                row[column] = 1
+        return matrix
+
+class SQLitePool:
+    """
+    Bounded pool of read-only sqlite3 connections for async handlers.
+
+    run() waits for an idle connection (up to timeout seconds, then raises
+    PoolTimeout) and calls fn(conn, *args) on the pool's own threads, one per
+    connection, so database work neither blocks the event loop nor competes
+    with model scoring for the default threadpool. Create and use it on the
+    event loop that serves requests.
+    """
+
+    def __init__(self, path: str, size: int = 4, timeout: float = 5.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='sqlite-pool')
+        self._idle: "asyncio.Queue[sqlite3.Connection]" = asyncio.Queue()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        # mode=ro fails on a missing file instead of creating an empty database.
+        # Each connection is used by one task at a time, on whichever pool
+        # thread runs its call.
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute('SELECT 1 FROM users LIMIT 1')
+        # Without it every lookup aggregates the user's orders from scratch; a
+        # read-only pool cannot create it, so refuse at startup instead
+        if not has_user_features(conn):
+            conn.close()
+            raise RuntimeError(f"{self.path} has no user_features table; run predict_churn.py --setup once")
+        return conn
+
+    async def open(self) -> None:
+        """Open every connection up front, so a bad path fails at startup"""
+        loop = asyncio.get_running_loop()
+        for _ in range(self.size):
+            conn = await loop.run_in_executor(self._executor, self._connect)
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def run(self, fn: Callable, *args):
+        try:
+            conn = await asyncio.wait_for(self._idle.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"No database connection free within {self.timeout}s") from None
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, conn, *args)
+        # The connection goes back only once the call has finished, even if
+        # the request awaiting it is cancelled first
+        future.add_done_callback(lambda _: self._idle.put_nowait(conn))
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict:
+        return {"size": self.size, "idle": self._idle.qsize()}
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+        self._executor.shutdown(wait=False)
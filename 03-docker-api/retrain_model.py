@@ -1,45 +1,146 @@
+# retrain_model.py - Retrain the API's churn model from scratch, or warm-start it with trees for new data
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
 import joblib
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
 
-print("🔄 Retraining model with current environment...")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+from model_bundle import file_version
+from tree_engine import FlatForest, container_path_for, file_signature
+
+def generate_customers(n_samples=1000, seed=42):
+    """Synthetic CustomerData rows with a churn label"""
+    np.random.seed(seed)
+
+    data = {
+        'age': np.random.randint(18, 70, n_samples),
+        'tenure': np.random.randint(1, 60, n_samples),
+        'monthly_charges': np.random.uniform(20, 100, n_samples),
+        'total_charges': np.random.uniform(50, 5000, n_samples),
+        'contract_type': np.random.choice(['Monthly', 'Yearly', 'Two-year'], n_samples),
+        'support_calls': np.random.randint(0, 10, n_samples)
+    }
+
+    df = pd.DataFrame(data)
+
+    # Create target variable
+    churn_prob = (df['support_calls'] > 5).astype(int) * 0.6 + \
+                 (df['monthly_charges'] > 70).astype(int) * 0.4
+    df['churn'] = (churn_prob + np.random.normal(0, 0.1, n_samples) > 0.5).astype(int)
+    return df
+
+def encode(df, feature_names=None):
+    """(X, y) with contract_type one-hot encoded, laid out as feature_names if given"""
+    df_processed = pd.get_dummies(df, columns=['contract_type'])
+    X = df_processed.drop('churn', axis=1)
+    if feature_names is not None:
+        # A window may lack some contract types; those columns are all 0
+        X = X.reindex(columns=feature_names, fill_value=0)
+    return X, df_processed['churn']
+
+def add_trees(model, X, y, n_new, max_trees=None, seed=None):
+    """
+    Warm-start model: fit n_new more trees on (X, y) only, keeping the trees
+    it already has, then drop the oldest ones beyond max_trees. The cost is
+    n_new trees on this window, however much data the old trees saw. The new
+    trees are seeded from seed, a fresh random one if None.
+    """
+    window_classes = set(np.unique(y))
+    if window_classes != set(model.classes_):
+        raise ValueError(f"Window has classes {sorted(window_classes)}, the model {list(model.classes_)}; "
+                         "every class must appear in the new data")
+    # sklearn seeds each tree from random_state and its position alone. Once
+    # old trees are dropped positions repeat, so reusing random_state would
+    # grow the dropped trees' seeds again
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + n_new, random_state=seed)
+    model.fit(X, y)
+    dropped = 0
+    if max_trees is not None and len(model.estimators_) > max_trees:
+        # Trees are appended in training order, so the oldest come first
+        dropped = len(model.estimators_) - max_trees
+        model.estimators_ = model.estimators_[dropped:]
+        model.n_estimators = max_trees
+    model.set_params(warm_start=False)
+    return dropped
 
-# Generate sample data
-np.random.seed(42)
-n_samples = 1000
+def save_model(model, feature_names, models_dir, **metadata):
+    """
+    Write models_dir/versions/churn_predictor-<version>.pkl and a line in
+    versions/history.jsonl, then atomically replace churn_predictor.pkl and
+    its churn_predictor.forest container so a watching API never reads a
+    half-written file. Returns the version.
+    """
+    versions_dir = os.path.join(models_dir, 'versions')
+    os.makedirs(versions_dir, exist_ok=True)
+    model_path = os.path.join(models_dir, 'churn_predictor.pkl')
+    parent = file_version(model_path) if os.path.exists(model_path) else None
 
-data = {
-    'age': np.random.randint(18, 70, n_samples),
-    'tenure': np.random.randint(1, 60, n_samples),
-    'monthly_charges': np.random.uniform(20, 100, n_samples),
-    'total_charges': np.random.uniform(50, 5000, n_samples),
-    'contract_type': np.random.choice(['Monthly', 'Yearly', 'Two-year'], n_samples),
-    'support_calls': np.random.randint(0, 10, n_samples)
-}
+    tmp_path = f"{model_path}.tmp-{os.getpid()}"
+    joblib.dump(model, tmp_path)
+    version = file_version(tmp_path)
+    shutil.copyfile(tmp_path, os.path.join(versions_dir, f'churn_predictor-{version}.pkl'))
+    with open(os.path.join(versions_dir, 'history.jsonl'), 'a') as f:
+        f.write(json.dumps({'version': version, 'parent': parent, 'trees': len(model.estimators_),
+                            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), **metadata}) + '\n')
 
-df = pd.DataFrame(data)
+    # Feature names first: they only change on a full retrain, and the model
+    # file is what the API's reload watcher keys on
+    names_path = os.path.join(models_dir, 'feature_names.pkl')
+    names_tmp_path = f"{names_path}.tmp-{os.getpid()}"
+    joblib.dump(list(feature_names), names_tmp_path)
+    os.replace(names_tmp_path, names_path)
+    os.replace(tmp_path, model_path)
+    FlatForest.from_sklearn(model).save_container(container_path_for(model_path), feature_names=list(feature_names),
+                                                  source=file_signature(model_path), version=version)
+    return version
 
-# Create target variable
-churn_prob = (df['support_calls'] > 5).astype(int) * 0.6 + \
-             (df['monthly_charges'] > 70).astype(int) * 0.4
-df['churn'] = (churn_prob + np.random.normal(0, 0.1, n_samples) > 0.5).astype(int)
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the API's churn model")
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--data', help='CSV of CustomerData columns plus churn (default: synthetic customers)')
+    parser.add_argument('--samples', type=int, default=1000, help='synthetic customers when --data is not given')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--incremental', action='store_true',
+                        help='add trees fitted on this data to the current model instead of starting over')
+    parser.add_argument('--n-estimators', type=int, default=100, help='trees of a full retrain')
+    parser.add_argument('--add-trees', type=int, default=20, help='trees an incremental retrain adds')
+    parser.add_argument('--max-trees', type=int, help='drop the oldest trees beyond this many')
+    args = parser.parse_args()
 
-# Preprocess data
-df_processed = pd.get_dummies(df, columns=['contract_type'])
+    df = pd.read_csv(args.data) if args.data else generate_customers(args.samples, args.seed)
+    started = time.perf_counter()
 
-X = df_processed.drop('churn', axis=1)
-y = df_processed['churn']
+    if args.incremental:
+        print(f"🔄 Adding {args.add_trees} trees for {len(df)} new customers...")
+        model = joblib.load(os.path.join(args.models_dir, 'churn_predictor.pkl'))
+        feature_names = joblib.load(os.path.join(args.models_dir, 'feature_names.pkl'))
+        X, y = encode(df, feature_names)
+        dropped = add_trees(model, X, y, args.add_trees, args.max_trees)
+        metadata = {'mode': 'incremental', 'added': args.add_trees, 'dropped': dropped, 'seed': model.random_state}
+    else:
+        print("🔄 Retraining model with current environment...")
+        X, y = encode(df)
+        feature_names = list(X.columns)
+        model = RandomForestClassifier(n_estimators=args.n_estimators, random_state=args.seed)
+        model.fit(X, y)
+        metadata = {'mode': 'full'}
 
-# Train model
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X, y)
+    seconds = time.perf_counter() - started
+    version = save_model(model, feature_names, args.models_dir, rows=len(df), seconds=round(seconds, 3), **metadata)
 
-# Save model and feature names
-joblib.dump(model, 'models/churn_predictor.pkl')
-joblib.dump(list(X.columns), 'models/feature_names.pkl')
+    print("✅ Model retrained and saved successfully!")
+    print(f"Feature names: {feature_names}")
+    print(f"Model score: {model.score(X, y):.3f}")
+    print(f"Version {version}: {len(model.estimators_)} trees, trained in {seconds:.2f}s")
 
-print("✅ Model retrained and saved successfully!")
-print(f"Feature names: {list(X.columns)}")
-print(f"Model score: {model.score(X, y):.3f}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# compact_model.py - Smaller FlatForest variants of churn_predictor.pkl, with their size, speed and accuracy cost
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../app')
+sys.path.insert(0, APP_DIR)
+
+from tree_engine import FlatForest, file_signature
+
+# Variants are scored on plain arrays, as the API does
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# Variants built when none are given on the command line: "key=value,..." with
+# trees (first n trees), depth, leaves (per tree) and float32 (thresholds and
+# class distributions stored as float32 instead of float64)
+DEFAULT_VARIANTS = [
+    'full', 'float32', 'trees=50,float32', 'trees=25,float32', 'depth=10,float32', 'depth=8,float32',
+    'depth=6,float32', 'leaves=128,float32', 'leaves=32,float32', 'trees=50,depth=8,float32',
+]
+
+def parse_variant(spec):
+    """from_sklearn keyword arguments of a variant spec such as 'trees=50,depth=8,float32'"""
+    options = {'n_trees': None, 'max_depth': None, 'max_leaf_nodes': None, 'dtype': np.float64}
+    keys = {'trees': 'n_trees', 'depth': 'max_depth', 'leaves': 'max_leaf_nodes'}
+    for part in filter(None, spec.split(',')):
+        key, _, value = part.partition('=')
+        if key == 'float32' and not value:
+            options['dtype'] = np.float32
+        elif key in keys and value.isdigit() and int(value) > 0:
+            options[keys[key]] = int(value)
+        elif key != 'full':
+            raise ValueError(f"Bad variant part {part!r}: expected trees=N, depth=N, leaves=N, float32 or full")
+    return options
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def median_seconds(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+def latencies(predictor, X, single_rows=500, batch_rows=1000, batch_repeats=20, seed=0):
+    """p50 / p99 microseconds of one-row predict_proba and milliseconds of a batch_rows batch"""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(X), single_rows)
+    batch = X[rng.integers(0, len(X), batch_rows)]
+    single, batched = [], []
+    predictor.predict_proba(X[:1])
+    for row in rows:
+        started = time.perf_counter()
+        predictor.predict_proba(X[row:row + 1])
+        single.append(time.perf_counter() - started)
+    for _ in range(batch_repeats):
+        started = time.perf_counter()
+        predictor.predict_proba(batch)
+        batched.append(time.perf_counter() - started)
+    return {'single_p50_us': float(np.percentile(single, 50) * 1e6),
+            'single_p99_us': float(np.percentile(single, 99) * 1e6),
+            'batch_p50_ms': float(np.percentile(batched, 50) * 1e3),
+            'batch_p99_ms': float(np.percentile(batched, 99) * 1e3)}
+
+def quality(proba, classes, y):
+    """Accuracy, and ROC AUC for a binary model, of predicted class probabilities against labels y"""
+    from sklearn.metrics import accuracy_score, roc_auc_score
+    result = {'accuracy': float(accuracy_score(y, classes[proba.argmax(axis=1)]))}
+    if len(classes) == 2 and len(np.unique(y)) == 2:
+        result['auc'] = float(roc_auc_score(y == classes[1], proba[:, 1]))
+    return result
+
+def compact(model, feature_names, X, y, variants, out_dir, source=None, timing_repeats=5, **latency_args):
+    """
+    Build, save and measure each variant. Returns one report per variant, the
+    first for the original model, each with its size, load time, latencies,
+    accuracy / AUC and their change against the original.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    reports = []
+
+    with tempfile.TemporaryDirectory(prefix='churn-compact-') as tmp:
+        pickle_path = os.path.join(tmp, 'churn_predictor.pkl')
+        joblib.dump(model, pickle_path)
+        original_proba = model.predict_proba(X)
+        original = {'variant': 'original (sklearn pickle)', 'trees': len(model.estimators_),
+                    'nodes': int(sum(e.tree_.node_count for e in model.estimators_)),
+                    'size_bytes': os.path.getsize(pickle_path),
+                    'load_ms': median_seconds(lambda: joblib.load(pickle_path), timing_repeats) * 1e3,
+                    **latencies(model, X, **latency_args), **quality(original_proba, model.classes_, y)}
+        reports.append(original)
+
+    for spec in variants:
+        forest = FlatForest.from_sklearn(model, **parse_variant(spec))
+        path = os.path.join(out_dir, f"churn_predictor-{spec.replace(',', '-').replace('=', '')}.flat")
+        shutil.rmtree(path, ignore_errors=True)
+        # With the source pickle's signature, a variant copied to
+        # models/churn_predictor.flat is served by MODEL_LOAD_MODE=mmap as is
+        forest.save(path, feature_names=list(feature_names), variant=spec, source=source)
+        proba = forest.predict_proba(X)
+        report = {'variant': spec, 'path': path, 'trees': forest.n_trees, 'nodes': forest.n_nodes,
+                  'size_bytes': directory_size(path),
+                  'load_ms': median_seconds(lambda: FlatForest.load(path, mmap_mode=None), timing_repeats) * 1e3,
+                  **latencies(forest, X, **latency_args), **quality(proba, forest.classes_, y),
+                  'max_abs_proba_change': float(np.abs(proba - original_proba).max())}
+        for metric in ('accuracy', 'auc'):
+            if metric in report:
+                report[f'{metric}_change'] = report[metric] - original[metric]
+        reports.append(report)
+    return reports
+
+def evaluation_data(feature_names, data_path=None, label='churn', samples=5000, seed=123):
+    """
+    (X, y) to score variants on: a CSV of raw or encoded features plus the
+    label column, or synthetic customers drawn with a seed the model was not
+    trained on.
+    """
+    if data_path:
+        df = pd.read_csv(data_path)
+    else:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+        from retrain_model import generate_customers
+        df = generate_customers(samples, seed)
+    y = df.pop(label).to_numpy()
+    X = pd.get_dummies(df).reindex(columns=feature_names, fill_value=0)
+    return X.to_numpy(dtype=np.float32), y
+
+def print_reports(reports):
+    print(f"{'variant':<26} {'trees':>5} {'nodes':>8} {'size KB':>9} {'load ms':>8} {'1-row p50/p99 us':>17} "
+          f"{'batch p50/p99 ms':>17} {'AUC':>7} {'dAUC':>8} {'acc':>7} {'dacc':>8}")
+    for r in reports:
+        auc = f"{r['auc']:>7.4f}" if 'auc' in r else f"{'-':>7}"
+        print(f"{r['variant']:<26} {r['trees']:>5} {r['nodes']:>8,} {r['size_bytes'] / 2**10:>9,.0f} "
+              f"{r['load_ms']:>8.1f} {r['single_p50_us']:>8.0f}/{r['single_p99_us']:<8.0f} "
+              f"{r['batch_p50_ms']:>8.1f}/{r['batch_p99_ms']:<8.1f} {auc} "
+              f"{r.get('auc_change', 0):>+8.4f} {r['accuracy']:>7.4f} {r.get('accuracy_change', 0):>+8.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Build smaller variants of the churn forest and report their cost')
+    parser.add_argument('--model', default='models/churn_predictor.pkl')
+    parser.add_argument('--feature-names', help='default: feature_names.pkl next to the model')
+    parser.add_argument('--variants', nargs='+', default=DEFAULT_VARIANTS,
+                        help="e.g. float32 trees=50,float32 depth=8 leaves=64,float32 'full' is float64 as is")
+    parser.add_argument('--data', help='CSV of feature columns plus the label (default: synthetic customers)')
+    parser.add_argument('--label', default='churn')
+    parser.add_argument('--samples', type=int, default=5000, help='synthetic customers when --data is not given')
+    parser.add_argument('--out-dir', default='models/compacted', help='where variant artifacts are written')
+    parser.add_argument('--output', help='also write the reports to this JSON file')
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    feature_names = joblib.load(args.feature_names or os.path.join(os.path.dirname(args.model), 'feature_names.pkl'))
+    X, y = evaluation_data(feature_names, args.data, args.label, args.samples)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    print(f"🗜️  {len(args.variants)} variants of {args.model} ({len(model.estimators_)} trees), "
+          f"scored on {len(X):,} rows\n")
+    reports = compact(model, feature_names, X, y, args.variants, args.out_dir, source=file_signature(args.model))
+    print_reports(reports)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n💾 Reports saved to {args.output}")
+    print(f"\n📦 Artifacts in {args.out_dir}; copy one to models/churn_predictor.flat to serve it "
+          f"with MODEL_LOAD_MODE=mmap")
+
+if __name__ == "__main__":
+    main()
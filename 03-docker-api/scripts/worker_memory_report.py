@@ -0,0 +1,69 @@
+# worker_memory_report.py - Compare per-worker memory for joblib vs mmap model loading
+import argparse
+import multiprocessing as mp
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../app')
+sys.path.insert(0, APP_DIR)
+
+def worker(mode, model_path, loaded, measured, results):
+    """Load the model like one API worker would and report memory around the load"""
+    from process_memory import process_memory
+
+    before = process_memory()
+    if mode == "mmap":
+        from tree_engine import FlatForest, flat_path_for
+        model = FlatForest.load(flat_path_for(model_path), mmap_mode='r')
+        # Touch every page once, as serving traffic eventually does
+        for name in ('feature', 'threshold', 'left', 'right', 'value'):
+            getattr(model, name).sum()
+    else:
+        import joblib
+        model = joblib.load(model_path)
+    after_load = process_memory()
+
+    # Measure again once every worker holds its model, so PSS splits shared pages
+    loaded.wait()
+    results.put((before, after_load, process_memory()))
+    measured.wait()
+
+def run(mode, model_path, n_workers):
+    ctx = mp.get_context('spawn')
+    loaded, measured = ctx.Barrier(n_workers), ctx.Barrier(n_workers + 1)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(mode, model_path, loaded, measured, results))
+                 for _ in range(n_workers)]
+    for p in processes:
+        p.start()
+    rows = [results.get() for _ in processes]
+    measured.wait()
+    for p in processes:
+        p.join()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-worker memory for joblib vs mmap model loading')
+    parser.add_argument('--model', default=os.path.join(APP_DIR, '../models/churn_predictor.pkl'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--modes', nargs='+', default=['joblib', 'mmap'])
+    args = parser.parse_args()
+
+    if 'mmap' in args.modes:
+        from tree_engine import export_flat_model
+        print(f"📦 Flat artifact: {export_flat_model(args.model)}")
+
+    print(f"🧪 Loading {args.model} in {args.workers} worker processes per mode\n")
+    for mode in args.modes:
+        rows = run(mode, args.model, args.workers)
+        print(f"📊 MODEL_LOAD_MODE={mode}")
+        print(f"   {'pid':>8} {'RSS before':>11} {'RSS after':>10} {'anon':>8} {'file':>8} {'PSS':>8}")
+        for before, _, steady in rows:
+            print(f"   {steady['pid']:>8} {before['rss_mb']:>9} MB {steady['rss_mb']:>7} MB "
+                  f"{steady['rss_anon_mb']:>5} MB {steady['rss_file_mb']:>5} MB {steady['pss_mb']:>5} MB")
+        growth = sum(steady['pss_mb'] - before['pss_mb'] for before, _, steady in rows)
+        total = sum(steady['pss_mb'] for _, _, steady in rows)
+        print(f"   Total PSS: {total:.1f} MB, of which {growth:.1f} MB added by loading the model\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import pytest
+import asyncio
+import numpy as np
 import sys
 import os
 
@@ -20,3 +22,510 @@ def test_basic_math():
     """Basic test to verify testing works"""
     result = 2 + 2
     assert result == 4
+
+# Make the churn API importable without installing it as a package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../03-docker-api/app'))
+
+@pytest.fixture
+def churn_api():
+    """Load main.py with a small model trained the same way as retrain_model.py"""
+    import numpy as np
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    import main
+    
+    np.random.seed(42)
+    n_samples = 200
+    df = pd.DataFrame({
+        'age': np.random.randint(18, 70, n_samples),
+        'tenure': np.random.randint(1, 60, n_samples),
+        'monthly_charges': np.random.uniform(20, 100, n_samples),
+        'total_charges': np.random.uniform(50, 5000, n_samples),
+        'contract_type': np.random.choice(['Monthly', 'Yearly', 'Two-year'], n_samples),
+        'support_calls': np.random.randint(0, 10, n_samples)
+    })
+    y = ((df['support_calls'] > 5) | (df['monthly_charges'] > 70)).astype(int)
+    X = pd.get_dummies(df, columns=['contract_type'])
+    
+    fitted = RandomForestClassifier(n_estimators=10, max_depth=5, random_state=42).fit(X, y)
+    main.bundle = main.make_bundle(fitted, list(X.columns), version='test')
+    yield main
+    main.bundle = None
+
+def sample_customers():
+    from main import CustomerData
+    return [
+        CustomerData(age=45, tenure=24, monthly_charges=75.5, total_charges=1800.0,
+                     contract_type='Monthly', support_calls=3),
+        CustomerData(age=30, tenure=2, monthly_charges=95.0, total_charges=190.0,
+                     contract_type='Two-year', support_calls=8),
+        CustomerData(age=61, tenure=50, monthly_charges=25.0, total_charges=1250.0,
+                     contract_type='Unknown', support_calls=0)
+    ]
+
+def test_batch_matches_single_predictions(churn_api):
+    """Batch scoring should agree with the single-row /predict endpoint"""
+    customers = sample_customers()
+    batch = churn_api.predict_churn_batch(customers)
+    
+    assert batch['total_processed'] == len(customers)
+    for customer, result in zip(customers, batch['predictions']):
+        single = asyncio.run(churn_api.predict_churn(customer))
+        assert result['churn_prediction'] == single['churn_prediction']
+        assert result['churn_probability'] == pytest.approx(single['churn_probability'])
+
+def test_batch_rejects_oversized_requests(churn_api, monkeypatch):
+    """Requests above MAX_BATCH_SIZE are refused instead of scored"""
+    from fastapi import HTTPException
+    monkeypatch.setattr(churn_api, 'MAX_BATCH_SIZE', 2)
+    
+    with pytest.raises(HTTPException) as excinfo:
+        churn_api.predict_churn_batch(sample_customers())
+    assert excinfo.value.status_code == 413
+
+def test_encoder_matches_get_dummies(churn_api):
+    """The precompiled encoder must reproduce the old pandas preprocessing"""
+    import numpy as np
+    import pandas as pd
+    customers = sample_customers()
+    
+    expected = pd.get_dummies(pd.DataFrame([c.dict() for c in customers]))
+    expected = expected.reindex(columns=churn_api.bundle.feature_names, fill_value=0)
+    
+    np.testing.assert_allclose(churn_api.bundle.encoder.encode_many(customers), expected.to_numpy(dtype=float), rtol=1e-6)
+    for i, customer in enumerate(customers):
+        np.testing.assert_allclose(churn_api.bundle.encoder.encode_one(customer)[0], expected.iloc[i].to_numpy(dtype=float), rtol=1e-6)
+
+def test_micro_batcher_coalesces_concurrent_requests(churn_api):
+    """Concurrent submits are scored together and each caller gets its own row"""
+    from batching import MicroBatcher
+    customers = sample_customers() * 10
+    expected = churn_api.score_customers(customers)
+    
+    async def run():
+        batcher = MicroBatcher(churn_api.score_customers, window_ms=5, max_batch_size=8)
+        await batcher.start()
+        try:
+            results = await asyncio.gather(*(batcher.submit(c) for c in customers))
+        finally:
+            await batcher.stop()
+        return results, batcher.stats.snapshot()
+    
+    results, stats = asyncio.run(run())
+    
+    assert [bool(label) for label, _, _ in results] == [bool(label) for label, _, _ in expected]
+    assert [p for _, p, _ in results] == pytest.approx([p for _, p, _ in expected])
+    assert stats['requests'] == len(customers)
+    assert stats['batches'] < len(customers)
+
+def test_micro_batcher_stop_fails_the_batch_being_scored():
+    """Stopping mid-batch resolves the batch's futures instead of leaving their handlers hanging"""
+    import threading
+    from batching import BatcherStopped, MicroBatcher
+    release = threading.Event()
+    
+    def slow_score(items):
+        release.wait(5)
+        return items
+    
+    async def run():
+        batcher = MicroBatcher(slow_score, window_ms=0, max_batch_size=8)
+        await batcher.start()
+        pending = [asyncio.ensure_future(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(0.05)  # the batch is now in the executor
+        await batcher.stop()
+        results = await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), 1)
+        release.set()
+        return results
+    
+    results = asyncio.run(run())
+    assert [type(r) for r in results] == [BatcherStopped] * 3
+    assert all('stopped' in str(r) for r in results)
+
+def test_predict_reports_the_batchers_bundle_and_503_when_stopped(churn_api, monkeypatch):
+    """Features and version come from the bundle that scored the row; a stopped batcher is a 503"""
+    from fastapi.testclient import TestClient
+    from batching import MicroBatcher
+    monkeypatch.setattr(churn_api, 'prediction_cache', None)
+    client = TestClient(churn_api.app)
+    reloaded = churn_api.make_bundle(churn_api.bundle.model, churn_api.bundle.feature_names[::-1], version='reloaded')
+
+    class SwappedMidRequest:
+        async def submit(self, customer):
+            return True, 0.9, reloaded
+
+    monkeypatch.setattr(churn_api, 'batcher', SwappedMidRequest())
+    response = client.post('/predict', json=sample_customers()[0].dict()).json()
+    assert response['model_version'] == 'reloaded'
+    assert response['features_used'] == reloaded.feature_names
+
+    monkeypatch.setattr(churn_api, 'batcher', MicroBatcher(churn_api.score_customers))
+    response = client.post('/predict', json=sample_customers()[0].dict())
+    assert response.status_code == 503
+    assert 'not running' in response.json()['detail']
+
+def test_prediction_cache_lru_ttl_and_version(monkeypatch):
+    """Cache evicts least recently used entries, expires old ones and resets on a new model"""
+    import prediction_cache
+    from prediction_cache import PredictionCache
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, 'monotonic', lambda: now[0])
+    
+    cache = PredictionCache(max_size=2, ttl_seconds=60)
+    cache.set_model_version('v1')
+    a, b, c = (cache.make_key(customer, 'v1') for customer in sample_customers())
+    
+    cache.put(a, (True, 0.9))
+    cache.put(b, (False, 0.1))
+    assert cache.get(a) == (True, 0.9)
+    cache.put(c, (False, 0.2))  # evicts b, the least recently used
+    assert cache.get(b) is None
+    assert cache.evictions == 1
+    
+    now[0] += 61
+    assert cache.get(a) is None
+    assert cache.expirations == 1
+    
+    cache.put(a, (True, 0.9))
+    cache.set_model_version('v2')
+    assert cache.stats()['size'] == 0
+    assert cache.make_key(sample_customers()[0], 'v2') != a
+
+def test_stream_scoring_chunks_and_reports_bad_rows(churn_api):
+    """Streamed CSV rows are scored in chunks, one result line per input row"""
+    import json
+    from bulk_scoring import score_stream
+    upload = (b"customer_id,age,tenure,monthly_charges,total_charges,contract_type,support_calls\n"
+              b"1,45,24,75.5,1800,Monthly,3\n2,30,2,95,190,Two-year,8\n3,oops,1,1,1,Monthly,1\n"
+              b"4,61,50,25,1250,Unknown,0\n5,1,2\n")
+    
+    async def chunks():
+        # Split mid-line to exercise the line buffering
+        for i in range(0, len(upload), 11):
+            yield upload[i:i + 11]
+    
+    async def score(features):
+        return churn_api.bundle.score_matrix(features)
+    
+    async def run():
+        return b''.join([part async for part in score_stream(chunks(), 'csv', churn_api.bundle.encoder, score, chunk_rows=2)])
+    
+    results = [json.loads(line) for line in asyncio.run(run()).splitlines()]
+    expected = churn_api.score_customers(sample_customers())
+    
+    assert [r['row'] for r in results] == [1, 2, 3, 4, 5]
+    assert 'error' in results[2] and 'error' in results[4]
+    for result, (label, probability, _) in zip([results[0], results[1], results[3]], expected):
+        assert result['churn_prediction'] == bool(label)
+        assert result['churn_probability'] == pytest.approx(probability)
+
+def test_stream_scoring_reports_bad_bytes_as_row_error(churn_api):
+    """A row that is not valid UTF-8 gets its own error line instead of aborting the response"""
+    import json
+    from fastapi.testclient import TestClient
+    good = sample_customers()[0].model_dump()
+    upload = (json.dumps({**good, 'customer_id': 'a'}).encode() + b'\n\xff\xfe\n'
+              + json.dumps({**good, 'customer_id': 'b'}).encode() + b'\n')
+    
+    response = TestClient(churn_api.app).post('/predict/stream', content=upload,
+                                              headers={'Content-Type': 'application/x-ndjson'})
+    
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r['row'] for r in results] == [1, 2, 3]
+    assert results[1]['error'].startswith('invalid UTF-8')
+    assert [results[0]['id'], results[2]['id']] == ['a', 'b']
+    assert results[0]['churn_probability'] == results[2]['churn_probability']
+
+def test_stream_scoring_splits_lines_across_chunks_and_caps_their_length(churn_api, monkeypatch):
+    """Lines split over many small chunks are rejoined; a line over the cap is a 413"""
+    import json
+    from fastapi.testclient import TestClient
+    from bulk_scoring import LineTooLong, iter_lines
+    data = b'first line\r\n\n' + b'x' * 100 + b'\nlast'
+
+    async def lines(chunk_size, max_line_bytes):
+        async def chunks():
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i + chunk_size]
+        return [line async for line in iter_lines(chunks(), max_line_bytes)]
+
+    assert asyncio.run(lines(3, 100)) == ['first line', 'x' * 100, 'last']
+    with pytest.raises(LineTooLong):
+        asyncio.run(lines(3, 99))
+    with pytest.raises(LineTooLong):
+        asyncio.run(lines(1000, 99))
+
+    monkeypatch.setattr(churn_api, 'STREAM_MAX_LINE_BYTES', 64)
+    upload = json.dumps(sample_customers()[0].model_dump()).encode() + b'\n'
+    response = TestClient(churn_api.app).post('/predict/stream', content=upload,
+                                              headers={'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 413
+
+def test_reload_swaps_model_atomically(churn_api, tmp_path, monkeypatch):
+    """A reload serves new requests from the new model; a held bundle keeps the old one"""
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier
+    old = churn_api.bundle
+    names = old.feature_names
+    rng = np.random.RandomState(0)
+    X = rng.uniform(0, 100, size=(100, len(names)))
+    new_model = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, (X[:, 0] > 50).astype(int))
+    joblib.dump(new_model, tmp_path / 'churn_predictor.pkl')
+    joblib.dump(names, tmp_path / 'feature_names.pkl')
+    monkeypatch.setattr(churn_api, 'models_dir', lambda: str(tmp_path))
+    
+    result = churn_api.reload_model()
+    
+    assert result == {"reloaded": True, "old_version": 'test', "new_version": churn_api.bundle.version}
+    assert churn_api.bundle is not old
+    assert churn_api.score_one(old, sample_customers()[0])  # in-flight holders still work
+    response = asyncio.run(churn_api.predict_churn(sample_customers()[0]))
+    assert response['model_version'] == churn_api.bundle.version
+    assert churn_api.reload_model()['reloaded'] is False
+
+def test_admin_reload_requires_token(churn_api, monkeypatch):
+    """/admin/reload checks X-Admin-Token, and is off in production when no token is set"""
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(churn_api, 'reload_model', lambda force: {"reloaded": False})
+    client = TestClient(churn_api.app)
+
+    monkeypatch.setattr(churn_api, 'STARTUP_MODE', 'production')
+    monkeypatch.setattr(churn_api, 'ADMIN_TOKEN', '')
+    assert client.post('/admin/reload').status_code == 403
+
+    monkeypatch.setattr(churn_api, 'ADMIN_TOKEN', 's3cret')
+    assert client.post('/admin/reload').status_code == 401
+    assert client.post('/admin/reload', headers={'X-Admin-Token': 'wrong'}).status_code == 401
+    response = client.post('/admin/reload', headers={'X-Admin-Token': 's3cret'})
+    assert response.status_code == 200 and response.json() == {"reloaded": False}
+
+def test_production_startup_serves_prebuilt_fallback(churn_api, tmp_path, monkeypatch):
+    """An unloadable model in production mode falls back to the prebuilt artifact"""
+    from build_fallback_model import build_fallback_model
+    build_fallback_model(str(tmp_path))
+    (tmp_path / 'churn_predictor.pkl').write_bytes(b'not a pickle')
+    (tmp_path / 'feature_names.pkl').write_bytes(b'not a pickle')
+    monkeypatch.setattr(churn_api, 'models_dir', lambda: str(tmp_path))
+    monkeypatch.setattr(churn_api, 'STARTUP_MODE', 'production')
+    
+    churn_api.load_model()
+    
+    assert churn_api.bundle.version == 'fallback'
+    assert churn_api.bundle.engine == 'FlatForest'
+    assert 'directory_listing_ms' not in churn_api.startup_timings
+    response = asyncio.run(churn_api.predict_churn(sample_customers()[0]))
+    assert response['model_version'] == 'fallback'
+
+def test_metrics_histograms_cover_predict_stages(churn_api, monkeypatch):
+    """One /predict request shows up once in every stage histogram on /metrics"""
+    from fastapi.testclient import TestClient
+    from metrics import PredictionMetrics
+    monkeypatch.setattr(churn_api.metrics, 'stages', PredictionMetrics().stages)
+    monkeypatch.setattr(churn_api, 'prediction_cache', None)
+    client = TestClient(churn_api.app)
+    
+    response = client.post('/predict', json=sample_customers()[0].dict())
+    assert response.status_code == 200
+    body = client.get('/metrics').text
+    
+    for stage in ('validation', 'encoding', 'inference', 'serialization'):
+        assert f'churn_predict_stage_seconds_count{{stage="{stage}"}} 1' in body
+        assert f'churn_predict_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} 1' in body
+    assert 'churn_requests_in_flight 0' in body  # /metrics itself is not a prediction request
+    
+    # A 503 before the handler runs adds no validation sample
+    monkeypatch.setattr(churn_api, 'bundle', None)
+    assert client.post('/predict', json=sample_customers()[0].dict()).status_code == 503
+    assert 'churn_predict_stage_seconds_count{stage="validation"} 1' in client.get('/metrics').text
+
+def test_predict_by_user_id_reads_features_from_pooled_db(churn_api, tmp_path, monkeypatch):
+    """ID endpoints score ecommerce users from the database like predict_churn.py does"""
+    import httpx
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    from test_model import make_ecommerce_db
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    from predict_churn import ChurnScorer, setup_database
+    
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    setup_database(db_path)
+    names = ['total_orders', 'total_spent', 'avg_order_value', 'days_since_last_order',
+             'active_months', 'unique_products_bought', 'orders_last_30_days',
+             'spent_last_30_days', 'country_Canada', 'country_UK', 'country_USA']
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.uniform(0, 100, size=(100, len(names))), columns=names)
+    model = RandomForestClassifier(n_estimators=10, random_state=42).fit(X, (X['total_spent'] > 50).astype(int))
+    joblib.dump(model, tmp_path / 'churn_predictor.pkl')
+    joblib.dump(names, tmp_path / 'feature_names.pkl')
+    with ChurnScorer(str(tmp_path / 'churn_predictor.pkl'), str(tmp_path / 'feature_names.pkl'), db_path) as scorer:
+        expected = scorer.score()
+        # Both templates of the shared feature SQL, materialized and point in time
+        from user_store import fetch_user_features
+        for as_of in (None, '2024-03-01'):
+            rows = fetch_user_features(scorer.conn, [5, 2, 999], as_of)
+            frame = scorer.load_features([5, 2, 999], as_of)
+            assert rows == list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+    
+    monkeypatch.setattr(churn_api, 'ECOMMERCE_DB_PATH', db_path)
+    monkeypatch.setattr(churn_api, 'USER_MODEL_DIR', str(tmp_path))
+    monkeypatch.setattr(churn_api, 'DB_POOL_SIZE', 2)
+    
+    async def run():
+        await churn_api.start_user_scoring()
+        transport = httpx.ASGITransport(app=churn_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            single = (await client.get('/predict/4')).json()
+            missing = await client.get('/predict/999')
+            # More concurrent batches than connections queue for the pool
+            batches = await asyncio.gather(*[client.post('/predict/batch', json=[5, 999, 2, 5])
+                                             for _ in range(6)])
+            payloads = await client.post('/predict/batch', json=[c.dict() for c in sample_customers()])
+        churn_api.db_pool.close()
+        return single, missing, batches, payloads
+    
+    try:
+        single, missing, batches, payloads = asyncio.run(run())
+    finally:
+        churn_api.user_bundle = churn_api.db_pool = None
+    
+    assert {k: single[k] for k in expected[4]} == expected[4]
+    assert missing.status_code == 404
+    for response in batches:
+        body = response.json()
+        assert body['total_processed'] == 4
+        assert body['predictions'] == [expected[5], {"user_id": 999, "error": "Customer not found"},
+                                       expected[2], expected[5]]
+    # CustomerData payloads on the same route still go to the feature-payload model
+    assert payloads.json()['model_version'] == 'test'
+    assert payloads.json()['total_processed'] == 3
+
+def test_incremental_retrain_adds_and_drops_trees(tmp_path):
+    """A warm-start retrain keeps the served trees, adds trees for the new window and versions the artifact"""
+    import json
+    import joblib
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../03-docker-api'))
+    from model_bundle import file_version
+    from retrain_model import add_trees, encode, generate_customers, save_model
+    from sklearn.ensemble import RandomForestClassifier
+    
+    X, y = encode(generate_customers(300, seed=0))
+    names = list(X.columns)
+    model = RandomForestClassifier(n_estimators=10, random_state=42).fit(X, y)
+    first = save_model(model, names, str(tmp_path), mode='full')
+    old_trees = list(model.estimators_)
+    
+    # A window without any Two-year contracts still lines up with the trained columns
+    window = generate_customers(100, seed=1)
+    X_new, y_new = encode(window[window['contract_type'] != 'Two-year'], names)
+    assert list(X_new.columns) == names
+    dropped = add_trees(model, X_new, y_new, n_new=5, max_trees=12)
+    assert dropped == 3 and len(model.estimators_) == 12 == model.n_estimators
+    assert model.estimators_[:7] == old_trees[3:]
+    assert model.predict_proba(X_new).shape == (len(X_new), 2)
+    # Refreshing again after the drop grows new trees, not the seeds of the dropped ones
+    refreshed = RandomForestClassifier(n_estimators=10, random_state=42).fit(X, y)
+    for _ in range(3):
+        add_trees(refreshed, X_new, y_new, n_new=5, max_trees=12)
+        assert len({tree.random_state for tree in refreshed.estimators_}) == 12
+    
+    second = save_model(model, names, str(tmp_path), mode='incremental', added=5, dropped=dropped)
+    assert second == file_version(str(tmp_path / 'churn_predictor.pkl')) != first
+    # Every file is renamed into place; no temporaries are left behind
+    assert not [p for p in os.listdir(tmp_path) if '.tmp-' in p]
+    history = [json.loads(line) for line in (tmp_path / 'versions' / 'history.jsonl').read_text().splitlines()]
+    assert [(h['version'], h['parent'], h['trees']) for h in history] == [(first, None, 10), (second, first, 12)]
+    assert len(joblib.load(tmp_path / 'versions' / f'churn_predictor-{first}.pkl').estimators_) == 10
+    
+    with pytest.raises(ValueError, match="every class"):
+        add_trees(model, X_new[y_new == 0], y_new[y_new == 0], n_new=5)
+
+def test_compacted_forest_variants(tmp_path):
+    """float32 storage keeps every split decision; tree, depth and leaf limits shrink the forest"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../03-docker-api'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../03-docker-api/scripts'))
+    from retrain_model import encode, generate_customers
+    from sklearn.ensemble import RandomForestClassifier
+    from compact_model import compact
+    from tree_engine import FlatForest
+    
+    X, y = encode(generate_customers(400, seed=0))
+    model = RandomForestClassifier(n_estimators=20, random_state=42).fit(X, y)
+    X_test, y_test = encode(generate_customers(300, seed=1), list(X.columns))
+    X_test = X_test.to_numpy(dtype=np.float32)
+    full = FlatForest.from_sklearn(model)
+    
+    compacted = FlatForest.from_sklearn(model, dtype=np.float32)
+    assert compacted.threshold.dtype == compacted.value.dtype == np.float32
+    np.testing.assert_array_equal(compacted.apply(X_test), full.apply(X_test))
+    np.testing.assert_allclose(compacted.predict_proba(X_test), model.predict_proba(X_test), atol=1e-6)
+    
+    # Limits the trees already meet change nothing
+    unlimited = FlatForest.from_sklearn(model, max_depth=full.max_depth, max_leaf_nodes=full.n_nodes)
+    np.testing.assert_array_equal(unlimited.predict_proba(X_test), full.predict_proba(X_test))
+    
+    assert FlatForest.from_sklearn(model, n_trees=5).n_trees == 5
+    shallow = FlatForest.from_sklearn(model, max_depth=3)
+    assert shallow.max_depth == 3 and shallow.n_nodes < full.n_nodes
+    small = FlatForest.from_sklearn(model, max_leaf_nodes=8)
+    leaves = np.flatnonzero(small.left == np.arange(small.n_nodes))
+    assert np.bincount(np.searchsorted(small.roots, leaves, side='right') - 1).max() <= 8
+    assert 0.5 < (small.predict(X_test) == y_test).mean()
+    
+    reports = compact(model, list(X.columns), X_test, y_test, ['full', 'float32', 'trees=5,depth=3,float32'],
+                      str(tmp_path), timing_repeats=1, single_rows=5, batch_rows=50, batch_repeats=2)
+    original, as_is, float32, tiny = reports
+    assert as_is['auc_change'] == 0 and as_is['max_abs_proba_change'] < 1e-9
+    assert abs(float32['auc_change']) < 1e-6
+    assert tiny['size_bytes'] < float32['size_bytes'] < as_is['size_bytes']
+    assert FlatForest.load(tiny['path']).n_trees == 5
+    assert all(r['single_p99_us'] >= r['single_p50_us'] > 0 for r in reports)
+
+def test_forest_container_serves_without_sklearn(tmp_path):
+    """A retrain exports a .forest container the API loads memory-mapped with sklearn and joblib unimportable"""
+    import subprocess
+    import pandas as pd
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../03-docker-api'))
+    from retrain_model import encode, generate_customers, save_model
+    from sklearn.ensemble import RandomForestClassifier
+    from tree_engine import FlatForest
+    
+    X, y = encode(generate_customers(300, seed=0))
+    model = RandomForestClassifier(n_estimators=10, random_state=42).fit(X, y)
+    version = save_model(model, list(X.columns), str(tmp_path / 'models'), mode='full')
+    path = str(tmp_path / 'models' / 'churn_predictor.forest')
+    
+    header = FlatForest.read_container_header(path)
+    assert header['feature_names'] == list(X.columns) and header['version'] == version
+    assert header['data_start'] % 64 == 0
+    forest = FlatForest.load_container(path)
+    assert isinstance(forest.threshold, np.memmap)
+    X_np = X.to_numpy(dtype=np.float32)
+    np.testing.assert_array_equal(forest.predict_proba(X_np), model.predict_proba(X_np))
+    np.testing.assert_array_equal(FlatForest.load_container(path, mmap_mode=None).apply(X_np), forest.apply(X_np))
+    with pytest.raises(ValueError, match="not a .forest container"):
+        FlatForest.read_container_header(str(tmp_path / 'models' / 'churn_predictor.pkl'))
+    
+    customer = dict(age=30, tenure=2, monthly_charges=95.0, total_charges=190.0,
+                    contract_type='Monthly', support_calls=8)
+    expected = model.predict_proba(pd.get_dummies(pd.DataFrame([customer]), columns=['contract_type'])
+                                   .reindex(columns=X.columns, fill_value=0))[0, 1]
+    script = f"""
+import asyncio, sys
+sys.modules['sklearn'] = sys.modules['joblib'] = None
+sys.path.insert(0, {os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + '/../../03-docker-api/app')!r})
+import main
+main.load_model()
+response = asyncio.run(main.predict_churn(main.CustomerData(**{customer!r})))
+print(main.bundle.engine, main.bundle.version, response['churn_probability'])
+"""
+    env = dict(os.environ, MODEL_LOAD_MODE='forest', STARTUP_MODE='production')
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    engine, served_version, probability = result.stdout.split()
+    # The version of the pickle, as recorded in versions/history.jsonl, not a hash of the container
+    assert (engine, served_version) == ('FlatForest', version)
+    assert float(probability) == pytest.approx(expected, abs=1e-3)
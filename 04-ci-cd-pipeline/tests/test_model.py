@@ -1,8 +1,13 @@
 import pytest
+import os
+import sys
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 
+# Make the churn API modules importable without installing them as a package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../03-docker-api/app'))
+
 def test_model_training():
     """Test that we can train a model"""
     # Generate sample data
@@ -43,3 +48,414 @@ def test_feature_consistency():
     expected_features = ['age', 'tenure', 'monthly_charges', 'total_charges', 'support_calls']
     assert len(expected_features) == 5
     assert 'age' in expected_features
+
+@pytest.mark.parametrize("n_classes,max_depth", [(2, None), (2, 4), (3, 10)])
+def test_flat_forest_matches_sklearn(n_classes, max_depth):
+    """The native tree engine must reproduce sklearn's probabilities"""
+    from tree_engine import FlatForest
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(300, 6))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int) + (n_classes == 3) * (X[:, 3] > 1)
+    
+    model = RandomForestClassifier(n_estimators=20, max_depth=max_depth, random_state=42).fit(X, y)
+    forest = FlatForest.from_sklearn(model)
+    
+    X_new = rng.normal(size=(50, 6))
+    np.testing.assert_allclose(forest.predict_proba(X_new), model.predict_proba(X_new), atol=1e-12)
+    np.testing.assert_array_equal(forest.predict(X_new), model.predict(X_new))
+    # Single rows take the same path as batches
+    np.testing.assert_allclose(forest.predict_proba(X_new[:1]), model.predict_proba(X_new[:1]), atol=1e-12)
+
+def test_flat_forest_memory_mapped_roundtrip(tmp_path):
+    """A saved FlatForest loads back memory-mapped and scores identically"""
+    from tree_engine import FlatForest
+    rng = np.random.RandomState(1)
+    X = rng.normal(size=(200, 5))
+    y = (X[:, 0] > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=5, random_state=42).fit(X, y)
+    
+    path = str(tmp_path / 'churn_predictor.flat')
+    FlatForest.from_sklearn(model).save(path, source='test')
+    loaded = FlatForest.load(path, mmap_mode='r')
+    
+    assert isinstance(loaded.threshold, np.memmap)
+    assert FlatForest.read_meta(path)['source'] == 'test'
+    np.testing.assert_allclose(loaded.predict_proba(X), model.predict_proba(X), atol=1e-12)
+
+def make_ecommerce_db(path, n_users=30):
+    """Small users/orders database in the 01-sql-foundations schema"""
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, email TEXT NOT NULL, signup_date DATE, country TEXT)')
+    conn.execute('CREATE TABLE orders (order_id INTEGER PRIMARY KEY, user_id INTEGER, product_id INTEGER, '
+                 'order_date DATE, quantity INTEGER, amount REAL, status TEXT)')
+    countries = ['USA', 'UK', 'Canada']
+    conn.executemany('INSERT INTO users VALUES (?, ?, ?, ?)',
+                     [(i, f'user{i}@email.com', '2024-01-01', countries[i % 3]) for i in range(1, n_users + 1)])
+    # Every third user never ordered, so their aggregates come back NULL
+    orders = [(None, i, 101 + j % 5, f'2024-0{1 + j % 9}-1{j % 10}', 1, 10.0 * (i + j), 'completed')
+              for i in range(1, n_users + 1) if i % 3 for j in range(i % 4 + 1)]
+    conn.executemany('INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)', orders)
+    conn.commit()
+    conn.close()
+
+def test_churn_scorer_matches_per_user_prediction(tmp_path):
+    """ChurnScorer scores many users at once exactly like one-at-a-time calls"""
+    import joblib
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    from predict_churn import ChurnScorer, setup_database
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    feature_names = ['total_orders', 'total_spent', 'avg_order_value', 'days_since_last_order',
+                     'active_months', 'unique_products_bought', 'orders_last_30_days',
+                     'spent_last_30_days', 'country_Canada', 'country_UK', 'country_USA']
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.uniform(0, 100, size=(100, len(feature_names))), columns=feature_names)
+    model = RandomForestClassifier(n_estimators=10, random_state=42).fit(X, (X['total_spent'] > 50).astype(int))
+    joblib.dump(model, tmp_path / 'model.pkl')
+    joblib.dump(feature_names, tmp_path / 'features.pkl')
+
+    # Without user_features the scorer aggregates orders itself and never changes the schema
+    with ChurnScorer(str(tmp_path / 'model.pkl'), str(tmp_path / 'features.pkl'), db_path) as scorer:
+        without_table = scorer.score()
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'user_features%'").fetchone() == (0,)
+    # A wrong path fails instead of creating an empty database
+    with pytest.raises(sqlite3.OperationalError):
+        ChurnScorer(str(tmp_path / 'model.pkl'), str(tmp_path / 'features.pkl'), str(tmp_path / 'missing.db'))
+    assert not os.path.exists(tmp_path / 'missing.db')
+    setup_database(db_path)
+
+    with ChurnScorer(str(tmp_path / 'model.pkl'), str(tmp_path / 'features.pkl'), db_path) as scorer:
+        everyone = scorer.score()
+        assert sorted(everyone) == list(range(1, 31))
+        assert everyone == without_table
+        # IDs are bound as one JSON array, duplicates and unknown IDs included
+        assert scorer.score(range(1, 31)) == everyone
+        ids, features = scorer.feature_matrix([30, 2, 2, 999, 9])
+        assert list(ids) == [2, 9, 30]
+        assert list(features.columns) == feature_names
+        for user_id in (1, 3, 17):
+            assert scorer.score_one(user_id) == everyone[user_id]
+        assert scorer.score_one(999) == "❌ Customer 999 not found!"
+        assert scorer.score([]) == {}
+
+def test_user_features_triggers_track_order_changes(tmp_path):
+    """user_features stays equal to aggregating orders from scratch after inserts, updates and deletes"""
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../01-sql-foundations/scripts'))
+    from user_features import FEATURES_QUERY, as_of_date, create_user_features
+
+    as_of = as_of_date()
+    from_scratch = f"""
+    SELECT u.user_id, u.country, COUNT(o.order_id) as total_orders, SUM(o.amount) as total_spent,
+           AVG(o.amount) as avg_order_value, MAX(o.order_date) as last_order_date,
+           COUNT(DISTINCT strftime('%Y-%m', o.order_date)) as active_months,
+           COUNT(DISTINCT o.product_id) as unique_products_bought,
+           SUM(CASE WHEN o.order_date >= date('{as_of}', '-30 days') THEN 1 ELSE 0 END) as orders_last_30_days,
+           SUM(CASE WHEN o.order_date >= date('{as_of}', '-30 days') THEN o.amount ELSE 0 END) as spent_last_30_days
+    FROM users u LEFT JOIN orders o ON u.user_id = o.user_id
+    GROUP BY u.user_id, u.country ORDER BY u.user_id
+    """
+    materialized = f"""
+    SELECT m.user_id, m.country, m.total_orders, m.total_spent, m.avg_order_value, f.last_order_date,
+           m.active_months, m.unique_products_bought, m.orders_last_30_days, m.spent_last_30_days
+    FROM ({FEATURES_QUERY.format(as_of=as_of, join='', where='')}) m LEFT JOIN user_features f ON f.user_id = m.user_id
+    """
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    conn = sqlite3.connect(db_path)
+    create_user_features(conn)
+    pd.testing.assert_frame_equal(pd.read_sql_query(materialized, conn), pd.read_sql_query(from_scratch, conn))
+
+    conn.execute(f"INSERT INTO orders VALUES (NULL, 3, 104, date('{as_of}', '-2 days'), 1, 42.0, 'processing')")
+    conn.execute("INSERT INTO orders VALUES (NULL, 4, 101, '2024-05-20', 2, 80.0, 'delivered')")
+    conn.execute("UPDATE orders SET amount = amount * 2 WHERE user_id = 5")
+    conn.execute("UPDATE orders SET user_id = 7 WHERE user_id = 8")
+    conn.execute("DELETE FROM orders WHERE user_id = 10")
+    conn.commit()
+    pd.testing.assert_frame_equal(pd.read_sql_query(materialized, conn), pd.read_sql_query(from_scratch, conn))
+    # Users left without orders have no materialized row at all
+    assert conn.execute('SELECT COUNT(*) FROM user_features WHERE user_id IN (8, 10)').fetchone()[0] == 0
+    conn.close()
+
+def test_churn_lookups_use_indexes(tmp_path):
+    """With the schema indexes, no churn lookup query plan scans a whole table"""
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../01-sql-foundations/scripts'))
+    from create_database import create_indexes
+    from query_plan_report import churn_queries, full_scans
+    from user_features import create_user_features
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    conn = sqlite3.connect(db_path)
+    create_indexes(conn)
+    create_user_features(conn)
+    for name, sql, params, lookup in churn_queries(conn):
+        plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        assert not (lookup and full_scans(plan)), (name, plan)
+    conn.close()
+
+def test_synthetic_generator_is_seedable(tmp_path):
+    """The same seed and arguments reproduce the same database"""
+    import argparse
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../01-sql-foundations/scripts'))
+    from generate_data import generate
+
+    def build(name):
+        args = argparse.Namespace(db=str(tmp_path / name), users=2000, products=50, orders_per_user=5.0,
+                                  churn_rate=0.3, seed=7, today='2026-01-01', chunk_users=700,
+                                  synchronous='OFF', cache_mb=16)
+        generate(args)
+        conn = sqlite3.connect(args.db)
+        orders = conn.execute('SELECT * FROM orders ORDER BY order_id').fetchall()
+        churned = conn.execute("SELECT AVG(last_order_date < date('2026-01-01', '-90 days')) "
+                               "FROM user_features").fetchone()[0]
+        conn.close()
+        return orders, churned
+
+    orders, churned = build('a.db')
+    assert build('b.db') == (orders, churned)
+    assert len(orders) > 5000
+    assert 0.15 < churned < 0.45
+
+def test_chunked_training_loader_matches_pandas(tmp_path):
+    """The streamed float32 training matrix equals read_sql_query + fillna + get_dummies"""
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    from training_data import load_training_data, training_query
+    from user_features import create_user_features
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    conn = sqlite3.connect(db_path)
+    create_user_features(conn)
+
+    df = pd.read_sql_query(training_query(conn, '2024-04-01'), conn).fillna(0)
+    expected = pd.get_dummies(df.drop(['user_id', 'is_churned'], axis=1), columns=['country'], prefix='country')
+    X, y = load_training_data(conn, '2024-04-01', chunksize=7)
+    conn.close()
+
+    assert list(X.columns) == list(expected.columns)
+    assert (X.dtypes == np.float32).all() and y.dtype == np.int8
+    np.testing.assert_allclose(X.to_numpy(), expected.to_numpy(dtype=np.float64), rtol=1e-6)
+    np.testing.assert_array_equal(y.to_numpy(), df['is_churned'].to_numpy())
+
+def test_training_data_leaves_the_callers_transaction_open(tmp_path):
+    """Loading inside an open transaction neither commits nor ends it"""
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    from training_data import load_training_data
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    conn = sqlite3.connect(db_path)
+    before = len(load_training_data(conn, '2024-04-01')[0])
+    conn.execute("INSERT INTO users VALUES (1000, 'new@email.com', '2024-03-01', 'UK')")
+    assert conn.in_transaction
+
+    assert len(load_training_data(conn, '2024-04-01')[0]) == before + 1
+    assert conn.in_transaction
+    conn.rollback()
+    assert len(load_training_data(conn, '2024-04-01')[0]) == before
+    conn.close()
+
+def test_training_pipeline_benchmark_reports_stages(tmp_path):
+    """A small benchmark run writes every stage of both pipelines to its JSON results"""
+    import json
+    import subprocess
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '../../02-ml-basics/scripts/benchmark_training_pipeline.py')
+    output = tmp_path / 'results.json'
+
+    subprocess.run([sys.executable, script, '--sizes', '300', '--n-estimators', '5', '--work-dir', str(tmp_path),
+                    '--output', str(output)], check=True, capture_output=True)
+
+    results = {r['pipeline']: r for r in json.loads(output.read_text())['results']}
+    assert set(results) == {'churn_prediction', 'retrain_model'}
+    assert list(results['churn_prediction']['stages']) == [
+        'baseline', 'extraction', 'encoding', 'split', 'fit', 'evaluation', 'dump']
+    assert results['churn_prediction']['rows'] == 300
+    assert 'incremental_fit' in results['retrain_model']['stages']
+    for result in results.values():
+        assert 'failed' not in result and result['n_estimators'] == 5
+        assert result['total_seconds'] == pytest.approx(sum(s['seconds'] for s in result['stages'].values()), abs=1e-3)
+
+def test_feature_cache_hits_invalidates_and_evicts(tmp_path, monkeypatch):
+    """A second load of an unchanged DB skips SQL; writes miss; old entries are evicted"""
+    import sqlite3
+    import time
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    import feature_cache
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    cache_dir = str(tmp_path / 'cache')
+    make_ecommerce_db(db_path)
+
+    X, y, from_cache = feature_cache.cached_training_data(db_path, cache_dir=cache_dir, max_entries=2)
+    assert not from_cache
+    with sqlite3.connect(db_path) as conn:  # loading never changes the schema
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'user_features%'").fetchone() == (0,)
+
+    def no_sql(*args, **kwargs):
+        raise AssertionError("cache hit must not touch the database")
+    monkeypatch.setattr(feature_cache.sqlite3, 'connect', no_sql)
+    X_cached, y_cached, from_cache = feature_cache.cached_training_data(db_path, cache_dir=cache_dir, max_entries=2)
+    assert from_cache
+    assert list(X_cached.columns) == list(X.columns)
+    np.testing.assert_array_equal(X_cached.to_numpy(), X.to_numpy())
+    np.testing.assert_array_equal(y_cached.to_numpy(), y.to_numpy())
+    monkeypatch.undo()
+
+    for amount in (5.0, 6.0):
+        time.sleep(0.01)
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO orders VALUES (NULL, 3, 101, date('now'), 1, ?, 'processing')", (amount,))
+        conn.commit()
+        conn.close()
+        assert not feature_cache.cached_training_data(db_path, cache_dir=cache_dir, max_entries=2)[2]
+    assert len(os.listdir(cache_dir)) == 2
+
+@pytest.mark.parametrize("as_of", ['2024-03-15', '2024-06-30', '2025-01-01'])
+def test_as_of_features_agree_across_paths(tmp_path, as_of):
+    """Materialized SQL, point-in-time SQL and the pandas path give the same features for a fixed as_of"""
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    from training_data import NUMERIC_FEATURES, feature_frame, load_training_data, training_data_from_frames
+    from user_features import FEATURES_QUERY, POINT_IN_TIME_FEATURES_QUERY, create_user_features
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    conn = sqlite3.connect(db_path)
+    create_user_features(conn)
+    users = pd.read_sql_query('SELECT * FROM users', conn)
+    orders = pd.read_sql_query('SELECT * FROM orders', conn)
+
+    point_in_time = pd.read_sql_query(POINT_IN_TIME_FEATURES_QUERY.format(as_of=as_of, join='', where=''), conn)
+    vectorized = feature_frame(users, orders, as_of)
+    pd.testing.assert_frame_equal(vectorized[['user_id', 'country'] + NUMERIC_FEATURES],
+                                  point_in_time, check_dtype=False)
+    if as_of >= orders['order_date'].max():
+        # With no later orders the materialized table answers too
+        materialized = pd.read_sql_query(FEATURES_QUERY.format(as_of=as_of, join='', where=''), conn)
+        pd.testing.assert_frame_equal(materialized, point_in_time, check_dtype=False)
+
+    X, y = load_training_data(conn, as_of)
+    X_frames, y_frames = training_data_from_frames(users, orders, as_of)
+    conn.close()
+    pd.testing.assert_frame_equal(X, X_frames)
+    pd.testing.assert_series_equal(y, y_frames)
+    # Nothing depends on the wall clock any more
+    pd.testing.assert_frame_equal(feature_frame(users, orders, as_of), vectorized)
+
+def test_as_of_counts_timestamped_orders_until_end_of_day(tmp_path):
+    """An order later on the as_of day counts on both SQL paths and in pandas; the next day's does not"""
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    from training_data import NUMERIC_FEATURES, feature_frame
+    from user_features import create_user_features, features_query
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    conn = sqlite3.connect(db_path)
+    create_user_features(conn)
+    conn.execute("INSERT INTO orders VALUES (NULL, 2, 101, '2024-09-30 18:45:00', 1, 500.0, 'completed')")
+    conn.commit()
+    users = pd.read_sql_query('SELECT * FROM users', conn)
+    orders = pd.read_sql_query('SELECT * FROM orders', conn)
+
+    def user_2(as_of):
+        rows = pd.read_sql_query(features_query(conn, as_of), conn)
+        return rows[rows['user_id'] == 2].iloc[0]
+
+    # Latest order is on the as_of day: the materialized path answers
+    on_the_day = user_2('2024-09-30')
+    assert on_the_day['orders_last_30_days'] == 1 and on_the_day['spent_last_30_days'] == 500.0
+    assert on_the_day['days_since_last_order'] == pytest.approx(5.25 / 24)
+    vectorized = feature_frame(users, orders, '2024-09-30')
+    pd.testing.assert_series_equal(vectorized[vectorized['user_id'] == 2].iloc[0][NUMERIC_FEATURES],
+                                   on_the_day[NUMERIC_FEATURES], check_dtype=False, check_names=False)
+
+    # A day earlier the point-in-time path leaves it out
+    day_before = user_2('2024-09-29')
+    assert day_before['orders_last_30_days'] == 0
+    assert day_before['total_orders'] == on_the_day['total_orders'] - 1
+    conn.close()
+
+@pytest.mark.parametrize("defer_features", [False, True])
+def test_bulk_order_ingestion_upserts_and_keeps_features_current(tmp_path, defer_features):
+    """CSV and NDJSON orders are appended or upserted on order_id, bad rows skipped, user_features kept exact"""
+    import sqlite3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../01-sql-foundations/scripts'))
+    from ingest_orders import ingest, parse_orders, read_records
+    from user_features import USER_AGGREGATES, create_user_features, drop_triggers
+
+    db_path = str(tmp_path / 'ecommerce.db')
+    make_ecommerce_db(db_path)
+    (tmp_path / 'orders.csv').write_text(
+        'order_id,user_id,product_id,order_date,quantity,amount,status\n'
+        '1,5,102,2024-06-01,2,55.5,delivered\n'   # moves order 1 from user 1 to user 5
+        '9001,3,101,2024-06-02,1,10.0,processing\n'
+        ',4,103,2024-06-03,1,12.5,\n'             # no order_id: appended with a new one
+        '9002,2,101,not-a-date,1,1.0,shipped\n'
+    )
+    (tmp_path / 'orders.ndjson').write_text(
+        '{"order_id": 9001, "user_id": 3, "order_date": "2024-06-04", "amount": 20.0}\n'
+        '{"user_id": 6, "order_date": "2024-06-05"}\n'
+        'not json\n'
+        '{"order_id": 9003, "user_id": 9, "product_id": 104, "order_date": "2024-06-06", "amount": 7.25}\n'
+    )
+    conn = sqlite3.connect(db_path)
+    create_user_features(conn)
+    before = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+    if defer_features:
+        drop_triggers(conn)
+        conn.commit()
+
+    rejected = {'count': 0, 'samples': []}
+    records = list(read_records(str(tmp_path / 'orders.csv'), 'csv')) + \
+        list(read_records(str(tmp_path / 'orders.ndjson'), 'ndjson'))
+    progress = []
+    written = ingest(conn, parse_orders(records, rejected), batch_rows=1, transaction_rows=2,
+                     defer_features=defer_features, progress=progress.append)
+    if defer_features:
+        create_user_features(conn)
+
+    assert written == 5 and progress == [2, 4, 5]
+    assert rejected['count'] == 3
+    assert [line for line, _ in rejected['samples']] == [5, 2, 3]
+    assert conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == before + 3
+    assert conn.execute('SELECT user_id, amount FROM orders WHERE order_id = 1').fetchone() == (5, 55.5)
+    assert conn.execute('SELECT amount, product_id FROM orders WHERE order_id = 9001').fetchone() == (20.0, None)
+    from_scratch = pd.read_sql_query(USER_AGGREGATES.format(where=''), conn)
+    materialized = pd.read_sql_query('SELECT * FROM user_features ORDER BY user_id', conn)
+    np.testing.assert_array_equal(materialized.to_numpy(), from_scratch.to_numpy())
+    triggers = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0]
+    conn.close()
+    assert triggers == 3
+
+def test_hyperparameter_search_parallel_matches_serial_and_prunes():
+    """Pooled trials score exactly like serial ones on the shared folds; hopeless trials stop early"""
+    from sklearn.datasets import make_classification
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../02-ml-basics/scripts'))
+    from hyperparameter_search import sample_trials, search
+
+    X, y = make_classification(n_samples=400, n_features=8, flip_y=0.05, random_state=0)
+    trials = sample_trials({'n_estimators': [5, 10], 'max_depth': [2, 4, None], 'min_samples_leaf': [1, 5]}, 4)
+
+    serial, _ = search(X, y, trials, n_folds=3, workers=1, prune_margin=np.inf)
+    parallel, _ = search(X, y, trials, n_folds=3, workers=2, prune_margin=np.inf)
+    assert [r['trial'] for r in parallel] == [r['trial'] for r in serial]
+    assert [r['scores'] for r in parallel] == [r['scores'] for r in serial]
+    assert not any(r['pruned'] for r in serial)
+
+    good, hopeless = {'n_estimators': 10, 'max_depth': None}, {'n_estimators': 1, 'max_depth': 1, 'max_features': 1}
+    results, _ = search(X, y, [good, hopeless], n_folds=4, workers=1, prune_margin=0.0)
+    assert [r['params'] for r in results] == [good, hopeless]
+    assert len(results[0]['scores']) == 4
+    assert results[1]['pruned'] and len(results[1]['scores']) == 2